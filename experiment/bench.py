@@ -0,0 +1,108 @@
+"""
+Benchmark suite for gating decoder changes: runs every impl x dataset x thread count, reports
+each with a 95% confidence interval, and compares the results with a stored baseline.
+
+    python -m experiment.bench --save_baseline   # before the change
+    python -m experiment.bench                   # after it; exits with 1 on a regression
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+
+from experiment.run import DATASET_MAP, benchmark
+
+RESULT_PATH = "./artifact/result/bench.json"
+BASELINE_PATH = "./artifact/result/bench_baseline.json"
+
+# two-sided 95% quantiles of Student's t distribution for 1..30 degrees of freedom
+T_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+def confidence_interval(seconds):
+    """95% confidence interval of the mean run time"""
+    mean = statistics.mean(seconds)
+    if len(seconds) < 2:
+        return [mean, mean]
+    df = len(seconds) - 1
+    t = T_95[df - 1] if df <= len(T_95) else 1.96
+    half = t * statistics.stdev(seconds) / math.sqrt(len(seconds))
+    return [mean - half, mean + half]
+
+def compare(results, baseline, threshold):
+    """
+    Prints the change of every result against the baseline and returns the keys that
+    regressed: slower by more than threshold, with the confidence intervals apart.
+    """
+    regressions = []
+    for key, res in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"[BENCH] {key}: not in the baseline")
+            continue
+        change = res["mean"] / base["mean"] - 1
+        regressed = change > threshold and res["ci"][0] > base["ci"][1]
+        print(f"[BENCH] {key}: {base['mean']:.4f}s -> {res['mean']:.4f}s ({change:+.1%})"
+              + (" REGRESSION" if regressed else ""))
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--impls", nargs="+", choices=["gg", "bl", "tpp", "spp"],
+                    default=["gg", "bl", "tpp", "spp"])
+    ap.add_argument("--datasets", nargs="+", default=list(DATASET_MAP.keys()))
+    ap.add_argument("--threads", nargs="+", type=int, default=[1, 2, 4, 8, 16])
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--warmup", type=int, default=2)
+    ap.add_argument("--build", default="build")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--save_baseline", action="store_true", help="store the results as the baseline")
+    ap.add_argument("--threshold", type=float, default=0.05,
+                    help="relative slowdown of the mean that counts as a regression")
+    args = ap.parse_args()
+
+    os.makedirs("./artifact/log/bench", exist_ok=True)
+    os.makedirs("./artifact/result", exist_ok=True)
+
+    results = {}
+    for impl in args.impls:
+        for dataset in args.datasets:
+            # the sequential decoders do not depend on the thread count
+            for threads in (args.threads if impl in ["tpp", "spp"] else [1]):
+                key = f"{impl}/{dataset}/{threads}"
+                res = benchmark(
+                    f"./artifact/log/bench/{impl}_{dataset}_{threads}.txt",
+                    dataset=dataset,
+                    impl=impl,
+                    threads=threads,
+                    runs=args.runs,
+                    warmup=args.warmup,
+                    build=args.build,
+                )
+                res["ci"] = confidence_interval(res["seconds"])
+                results[key] = res
+                print(f"[BENCH] {key}: mean={res['mean']:.4f}s ci=[{res['ci'][0]:.4f}, {res['ci'][1]:.4f}] "
+                      f"p50={res['p50']:.4f}s p99={res['p99']:.4f}s {res['bytes_per_second'] / 1e6:.1f} MB/s")
+
+    with open(RESULT_PATH, "w") as f:
+        json.dump(results, f, indent=1)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"[BENCH] {len(regressions)} regression(s): {' '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Fits the decoder cost model of impl=auto (CostModel in src/cpp/lib.h) on the local machine.
+BL, TPP and SPP are benchmarked on generated inputs of every schema, over input sizes and
+thread counts. The coefficients of each implementation are then fit by least squares on the
+relative error of the predicted time.
+
+    python -m experiment.calibrate            # measure and fit
+    python -m experiment.calibrate --refit    # fit the stored measurements again
+"""
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+
+from experiment.run import SYNTHETIC_SCHEMAS, benchmark, generate_synthetic_dataset
+
+MEASUREMENTS_PATH = "./artifact/result/calibration.json"
+MODEL_PATH = "./artifact/result/cost_model.txt"
+
+# as SampleTextShare in lib.h
+TEXT_SAMPLE_WINDOWS = 16
+TEXT_SAMPLE_WINDOW = 4096
+
+def sample_text_share(path):
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    windows = min(TEXT_SAMPLE_WINDOWS, (size + TEXT_SAMPLE_WINDOW - 1) // TEXT_SAMPLE_WINDOW)
+    sampled = text = 0
+    with open(path, "rb") as f:
+        for w in range(windows):
+            f.seek(0 if windows == 1 else (size - min(size, TEXT_SAMPLE_WINDOW)) * w // (windows - 1))
+            window = f.read(TEXT_SAMPLE_WINDOW)
+            text += sum(0x20 <= b < 0x7f for b in window)
+            sampled += len(window)
+    return text / sampled
+
+def schema_features(schema):
+    """the SPP::Features the decoders of the schema were generated with: ambiguity, depth, string share"""
+    with open(f"./artifact/generated/{schema}.spp.h") as f:
+        m = re.search(r"SchemaFeatures Features = \{([^}]*)\}", f.read())
+    if not m:
+        raise RuntimeError(f"SchemaFeatures not found in the SPP header of {schema}")
+    return [float(v) for v in m.group(1).split(",")]
+
+def features(point):
+    """x = (1, ambiguity, depth, string share), as in CostModel::Choose with sampling"""
+    return [1.0, point["ambiguity"], point["depth"], point["text_share"]]
+
+def design_row(point):
+    x, n, t = features(point), point["bytes"], point["threads"]
+    return [1.0, t] + [n * v for v in x] + [n * v / t for v in x]
+
+def nnls(a, b, iterations=5000):
+    """min |a x - b| subject to x >= 0, by projected coordinate descent"""
+    g, h = a.T @ a, a.T @ b
+    x = np.zeros(a.shape[1])
+    for _ in range(iterations):
+        for j in range(len(x)):
+            if g[j, j] > 0:
+                x[j] = max(0.0, x[j] + (h[j] - g[j] @ x) / g[j, j])
+    return x
+
+def fit(points, sequential):
+    """
+    the coefficients (fixed, per_thread, serial x4, parallel x4) minimizing the relative error,
+    none negative since they are costs; a sequential implementation has no per-thread or
+    parallel part
+    """
+    rows = np.array([design_row(point) for point in points])
+    seconds = np.array([point["seconds"] for point in points])
+    columns = [0] + list(range(2, 6)) if sequential else list(range(10))
+    a = rows[:, columns] / seconds[:, None]
+    scale = np.linalg.norm(a, axis=0)
+    scale[scale == 0] = 1
+    coefficients = np.zeros(10)
+    coefficients[columns] = nnls(a / scale, np.ones(len(points))) / scale
+    return coefficients
+
+def predict(coefficients, point):
+    x, n, t = features(point), point["bytes"], point["threads"]
+    serial = float(np.dot(coefficients[2:6], x))
+    parallel = float(np.dot(coefficients[6:10], x))
+    return coefficients[0] + coefficients[1] * t + n * (serial + parallel / t)
+
+def measure(schemas, sizes_kb, threads, runs):
+    os.makedirs("./artifact/log/calibrate", exist_ok=True)
+
+    points = []
+    for schema in schemas:
+        ambiguity, depth, _ = schema_features(schema)
+        for size_kb in sizes_kb:
+            dataset = f"{schema}_calib_{size_kb}KB"
+            path = generate_synthetic_dataset(schema, dataset, size_kb / 1024)
+            for impl in ["bl", "tpp", "spp"]:
+                for t in threads if impl != "bl" else [1]:
+                    res = benchmark(
+                        f"./artifact/log/calibrate/{impl}_{dataset}_{t}.txt",
+                        dataset=dataset,
+                        schema=schema,
+                        impl=impl,
+                        threads=t,
+                        runs=runs,
+                    )
+                    points.append({
+                        "schema": schema,
+                        "impl": impl,
+                        "threads": t,
+                        "bytes": res["bytes"],
+                        "seconds": res["mean"],
+                        "ambiguity": ambiguity,
+                        "depth": depth,
+                        "text_share": sample_text_share(path),
+                    })
+    return points
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--schemas", nargs="+", default=SYNTHETIC_SCHEMAS)
+    ap.add_argument("--sizes", nargs="+", type=int, default=[16, 256, 4096, 65536],
+                    help="input sizes in KB")
+    ap.add_argument("--threads", nargs="+", type=int, default=[1, 2, 4, 8, 16])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--refit", action="store_true", help=f"fit the measurements in {MEASUREMENTS_PATH}")
+    ap.add_argument("--out", default=MODEL_PATH)
+    args = ap.parse_args()
+
+    os.makedirs("./artifact/result", exist_ok=True)
+    if args.refit:
+        with open(MEASUREMENTS_PATH) as f:
+            points = json.load(f)
+    else:
+        points = measure(args.schemas, args.sizes, args.threads, args.runs)
+        with open(MEASUREMENTS_PATH, "w") as f:
+            json.dump(points, f, indent=1)
+
+    models = {}
+    with open(args.out, "w") as f:
+        for impl in ["bl", "tpp", "spp"]:
+            impl_points = [point for point in points if point["impl"] == impl]
+            models[impl] = fit(impl_points, sequential=impl == "bl")
+            errors = sorted(abs(predict(models[impl], point) / point["seconds"] - 1) for point in impl_points)
+            print(f"[CALIBRATE] {impl}: median relative error {errors[len(errors) // 2]:.1%} "
+                  f"over {len(impl_points)} measurements")
+            f.write(" ".join([impl] + [f"{c:.6g}" for c in models[impl]]) + "\n")
+
+    # how often the model's pick is within 10% of the fastest measured decoder
+    inputs = {(point["schema"], point["bytes"]) for point in points}
+    good = 0
+    for key in inputs:
+        candidates = [point for point in points if (point["schema"], point["bytes"]) == key]
+        pick = min(candidates, key=lambda point: predict(models[point["impl"]], point))
+        good += pick["seconds"] <= 1.1 * min(point["seconds"] for point in candidates)
+    print(f"[CALIBRATE] the pick is within 10% of the fastest on {good}/{len(inputs)} inputs; "
+          f"wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ from matplotlib.backends.backend_pdf import PdfPages
 import pandas as pd
 
 datasets = ['PROF', 'MAP', 'PRD', 'TT', 'SYN1', 'SYN2', 'SYN3']
-algorithms = ['Baseline', 'SpecProto without Type Prioritization', 'SpecProto']
+algorithms = ['Baseline', 'SpecProto without Type Prioritization', 'SpecProto', 'SpecProto with Profile']
 
 csv_file = "./artifact/result/benefits_of_type_prioritization.csv"
 pdf_filename = "./artifact/figure/benefits_of_type_prioritization.pdf"
@@ -18,13 +18,15 @@ x = np.arange(len(datasets)) * 0.8
 max_height = 3 # the max height of bar
 width = 0.16
 
-hatches = ['///', '\\\\\\', '---'] 
+hatches = ['///', '\\\\\\', '---', 'xxx'] 
 
 with PdfPages(pdf_filename) as pdf:
     fig, ax = plt.subplots(figsize=(10, 4))
 
-    for i, alg in enumerate(algorithms):
-        bars = ax.bar(x + (i - 1) * width, execution_times[i], width, label=alg, alpha=.5)
+    # the profile-guided variant is only measured when its build exists
+    n = len(execution_times)
+    for i, alg in enumerate(algorithms[:n]):
+        bars = ax.bar(x + (i - (n - 1) / 2) * width, execution_times[i], width, label=alg, alpha=.5)
 
         for j, bar in enumerate(bars):
             bar.set_hatch(hatches[i])
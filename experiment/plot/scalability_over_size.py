@@ -2,7 +2,7 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_pdf import PdfPages
 import pandas as pd
 
-X_values = [50, 100, 200, 400, 800, 1600]
+X_values = [50, 100, 200, 400, 800, 1600, 3200, 6400]
 
 csv_file = "./artifact/result/scalability_over_size.csv"
 pdf_filename = "./artifact/figure/scalability_over_size.pdf"
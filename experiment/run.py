@@ -6,6 +6,7 @@ from pathlib import Path
 import sys
 import csv
 import re
+import json
 
 BIN = "./artifact/{build}/{schema}/{schema}.test"
 
@@ -24,8 +25,16 @@ DATASET_TO_SCHEMA = {
     "twitter_stream_400MB": "twitter_stream",
     "twitter_stream_800MB": "twitter_stream",
     "twitter_stream_1600MB": "twitter_stream",
+    "twitter_stream_3200MB": "twitter_stream",
+    "twitter_stream_6400MB": "twitter_stream",
+
+    # length-delimited records (--input_format=delimited or batch)
+    "pprof_profile_stream": "pprof_profile",
 }
 
+# inputs of 4 GiB and more need the build with 64-bit offsets (-DLARGE_INPUT)
+LARGE_INPUT_SIZE_MB = 4096
+
 DATASET_MAP = {
     "pprof_profile": "PROF",
     "google_map": "MAP",
@@ -36,18 +45,21 @@ DATASET_MAP = {
     "synth_tree": "SYN3",
 }
 
-def run(test_mode, dataset, impl, threads, runs, build="build", cmds=None):
+def run(test_mode, dataset, impl, threads, runs, build="build", cmds=None, simd="auto", malloc="mimalloc",
+        chunks_per_thread=1, min_chunk_size=0, schedule="static", pipeline_merge=1,
+        input_format="message", columnar=0, to_pb=0, adaptive_candidates=0,
+        filter_starts=1, metrics_json=None, warmup=1, results_json=None, schema=None,
+        cost_model=None, reuse_context=0, io="mmap", io_sequential=0, io_huge_pages=0, cold_runs=0):
     env = copy.deepcopy(os.environ)
 
     env["OMP_NUM_THREADS"] = str(threads)
     env["OMP_PLACES"] = "cores"
     env["OMP_PROC_BIND"] = "close"
-    env["LD_PRELOAD"] = "./third_party/mimalloc/libmimalloc.so"
+    if malloc == "mimalloc":
+        env["LD_PRELOAD"] = "./third_party/mimalloc/libmimalloc.so"
 
-    if dataset in DATASET_TO_SCHEMA:
-        schema = DATASET_TO_SCHEMA[dataset]
-    else:
-        schema = dataset
+    if schema is None:
+        schema = DATASET_TO_SCHEMA.get(dataset, dataset)
     
     bin = BIN.format(build=build, schema=schema)
 
@@ -57,12 +69,34 @@ def run(test_mode, dataset, impl, threads, runs, build="build", cmds=None):
         f"--test_mode={test_mode}",
         f"--impl={impl}",
         f"--runs={runs}",
+        f"--simd={simd}",
+        f"--chunks_per_thread={chunks_per_thread}",
+        f"--min_chunk_size={min_chunk_size}",
+        f"--schedule={schedule}",
+        f"--pipeline_merge={pipeline_merge}",
+        f"--input_format={input_format}",
+        f"--columnar={columnar}",
+        f"--to_pb={to_pb}",
+        f"--adaptive_candidates={adaptive_candidates}",
+        f"--filter_starts={filter_starts}",
+        f"--warmup={warmup}",
+        f"--reuse_context={reuse_context}",
+        f"--io={io}",
+        f"--io_sequential={io_sequential}",
+        f"--io_huge_pages={io_huge_pages}",
+        f"--cold_runs={cold_runs}",
     ]
+    if metrics_json:
+        cmd.append(f"--metrics_json={metrics_json}")
+    if results_json:
+        cmd.append(f"--results_json={results_json}")
+    if cost_model:
+        cmd.append(f"--cost_model={cost_model}")
 
     if cmds:
         cmd = cmds + cmd
 
-    print(f"[RUN] bin={bin} schema={schema} dataset={dataset} test_mode={test_mode} impl={impl} threads={threads} runs={runs}")
+    print(f"[RUN] bin={bin} schema={schema} dataset={dataset} test_mode={test_mode} impl={impl} threads={threads} runs={runs} simd={simd} malloc={malloc} chunks_per_thread={chunks_per_thread} schedule={schedule} pipeline_merge={pipeline_merge} input_format={input_format} columnar={columnar} to_pb={to_pb} adaptive_candidates={adaptive_candidates} filter_starts={filter_starts} reuse_context={reuse_context} io={io} io_sequential={io_sequential} io_huge_pages={io_huge_pages} cold_runs={cold_runs}")
     res = subprocess.run(
         cmd,
         env=env,
@@ -74,28 +108,33 @@ def run(test_mode, dataset, impl, threads, runs, build="build", cmds=None):
     print(res.stderr, end="", file=sys.stderr)
     return res.stdout, res.stderr
 
+def benchmark(log_path, **kwargs):
+    """
+    Runs `run` in benchmark mode, saves its stdout to log_path and returns the
+    BenchmarkResult the test binary wrote next to it (see --results_json): the timings of
+    every measured run, their mean, stddev and percentiles, bytes/s and the thread count.
+    """
+    results_json = os.path.splitext(log_path)[0] + ".json"
+    res_stdout, _ = run(test_mode="B", results_json=results_json, **kwargs)
+    with open(log_path, "w") as f:
+        f.write(res_stdout)
+    with open(results_json) as f:
+        return json.load(f)
+
 def run_overall_execution_time():
     os.makedirs("./artifact/log/overall_execution_time", exist_ok=True)
 
-    extract_pattern = re.compile(r"execution_time:\s*([0-9.]+)")
-
     results = {}
     for impl in ["bl", "tpp", "spp"]:
         for dataset in DATASET_MAP.keys():
-            res_stdout, _ = run(
-                test_mode="B",
+            res = benchmark(
+                f"./artifact/log/overall_execution_time/{impl}_{dataset}.txt",
                 dataset=dataset,
                 impl=impl,
                 threads=16,
                 runs=5,
             )
-            with open(f"./artifact/log/overall_execution_time/{impl}_{dataset}.txt", "w") as f:
-                f.write(res_stdout)
-            m = extract_pattern.search(res_stdout)
-            if not m:
-                raise RuntimeError("execution_time not found in stdout")
-
-            results.setdefault(impl, {})[dataset] = round(float(m.group(1)), 3)
+            results.setdefault(impl, {})[dataset] = round(res["mean"], 3)
 
     with open("./artifact/result/overall_execution_time.csv", "w") as f:
         writer = csv.writer(f)
@@ -179,36 +218,27 @@ def run_memory_overhead_over_threads():
 def run_time_breakdown_spec():
     os.makedirs("./artifact/log/time_breakdown_spec", exist_ok=True)
 
-    extract_pattern = re.compile(r"speculatively_parsing_time:\s*([0-9.]+)")
-    extract_pattern2 = re.compile(r"execution_time:\s*([0-9.]+)")
     results = {}
     impl = "spp"
     runs = 5
     for dataset in DATASET_MAP.keys():
-        res_stdout, _ = run(
-            test_mode="B",
+        log_path = f"./artifact/log/time_breakdown_spec/{impl}_{dataset}.txt"
+        # the SppMetrics of the last Parse, a measured run
+        metrics_json = f"./artifact/log/time_breakdown_spec/{impl}_{dataset}_metrics.json"
+        benchmark(
+            log_path,
             dataset=dataset,
             impl=impl,
             threads=16,
             runs=runs,
+            metrics_json=metrics_json,
         )
-        with open(f"./artifact/log/time_breakdown_spec/{impl}_{dataset}.txt", "w") as f:
-            f.write(res_stdout)
-        m = extract_pattern.findall(res_stdout)
-        if not m:
-            raise RuntimeError("speculatively_parsing_time not found in stdout")
-        m2 = extract_pattern2.search(res_stdout)
-        if not m2:
-            raise RuntimeError("execution_time not found in stdout")
-
-        assert len(m) == runs+1, f"speculatively_parsing_time should exist {runs+1} times, got {len(m)}"
-        
-        m = m[1:]
-        spec_time = float(sum([float(x) for x in m]) / runs)
+        with open(metrics_json) as f:
+            metrics = json.load(f)
 
         results[dataset] = {
-            "spec_time": round(spec_time, 3),
-            "merge_time": round(float(m2.group(1))-spec_time, 4),
+            "spec_time": round(metrics["speculate_time"], 3),
+            "merge_time": round(metrics["merge_time"], 4),
         }
 
     with open("./artifact/result/time_breakdown_spec.csv", "w") as f:
@@ -220,31 +250,31 @@ def run_time_breakdown_spec():
 def run_benefits_of_type_prioritization():
     os.makedirs("./artifact/log/benefits_of_type_prioritization", exist_ok=True)
 
-    extract_pattern = re.compile(r"execution_time:\s*([0-9.]+)")
+    impls = ["bl", "spp_disable_type_prioritization", "spp"]
+    # candidates ordered by a profile of the datasets, see `make gen_profiled_pbs`
+    if os.path.isdir("./artifact/build/profile"):
+        impls.append("spp_profile")
 
     results = {}
-    for impl in ["bl", "spp_disable_type_prioritization", "spp"]:
+    for impl in impls:
         for dataset in DATASET_MAP.keys():
             build = "build"
             run_impl = impl
             if impl == "spp_disable_type_prioritization":
                 build = "build/disable_type_prioritization"
                 run_impl = "spp"
-            res_stdout, _ = run(
-                test_mode="B",
+            elif impl == "spp_profile":
+                build = "build/profile"
+                run_impl = "spp"
+            res = benchmark(
+                f"./artifact/log/benefits_of_type_prioritization/{impl}_{dataset}.txt",
                 dataset=dataset,
                 impl=run_impl,
                 threads=16,
                 runs=5,
                 build=build,
             )
-            with open(f"./artifact/log/benefits_of_type_prioritization/{impl}_{dataset}.txt", "w") as f:
-                f.write(res_stdout)
-            m = extract_pattern.search(res_stdout)
-            if not m:
-                raise RuntimeError("execution_time not found in stdout")
-
-            results.setdefault(impl, {})[dataset] = round(float(m.group(1)), 3)
+            results.setdefault(impl, {})[dataset] = round(res["mean"], 3)
     
     with open("./artifact/result/benefits_of_type_prioritization.csv", "w") as f:
         writer = csv.writer(f)
@@ -255,26 +285,18 @@ def run_benefits_of_type_prioritization():
 def run_scalability_over_threads():
     os.makedirs("./artifact/log/scalability_over_threads", exist_ok=True)
 
-    extract_pattern = re.compile(r"execution_time:\s*([0-9.]+)")
-
     results = {}
     impl = "spp"
     for threads in [1, 2, 4, 8, 16]:
         for dataset in DATASET_MAP.keys():
-            res_stdout, _ = run(
-                test_mode="B",
+            res = benchmark(
+                f"./artifact/log/scalability_over_threads/{impl}_{dataset}_{threads}.txt",
                 dataset=dataset,
                 impl=impl,
                 threads=threads,
                 runs=5,
             )
-            with open(f"./artifact/log/scalability_over_threads/{impl}_{dataset}_{threads}.txt", "w") as f:
-                f.write(res_stdout)
-            m = extract_pattern.search(res_stdout)
-            if not m:
-                raise RuntimeError("execution_time not found in stdout")
-
-            results.setdefault(threads, {})[dataset] = round(float(m.group(1)), 3)
+            results.setdefault(threads, {})[dataset] = round(res["mean"], 3)
 
     with open("./artifact/result/scalability_over_threads.csv", "w") as f:
         writer = csv.writer(f)
@@ -285,26 +307,19 @@ def run_scalability_over_threads():
 def run_scalability_over_size():
     os.makedirs("./artifact/log/scalability_over_size", exist_ok=True)
 
-    extract_pattern = re.compile(r"execution_time:\s*([0-9.]+)")
-
     impl = "spp"
     dataset = "twitter_stream"
     results = {}
-    for size in [50, 100, 200, 400, 800, 1600]:
-        res_stdout, _ = run(
-            test_mode="B",
+    for size in [50, 100, 200, 400, 800, 1600, 3200, 6400]:
+        res = benchmark(
+            f"./artifact/log/scalability_over_size/{impl}_twitter_stream_{size}MB.txt",
             dataset=dataset + f"_{size}MB",
             impl=impl,
             threads=16,
             runs=5,
+            build="build/large" if size >= LARGE_INPUT_SIZE_MB else "build",
         )
-        with open(f"./artifact/log/scalability_over_size/{impl}_twitter_stream_{size}MB.txt", "w") as f:
-            f.write(res_stdout)
-        m = extract_pattern.search(res_stdout)
-        if not m:
-            raise RuntimeError("execution_time not found in stdout")
-
-        results[size] = round(float(m.group(1)), 3)
+        results[size] = round(res["mean"], 3)
 
     with open("./artifact/result/scalability_over_size.csv", "w") as f:
         writer = csv.writer(f)
@@ -317,37 +332,274 @@ def run_cost_breakdown_spec():
 
     extract_pattern = re.compile(r"visited_byte_cnt_total:\s*([0-9.]+)")
     extract_pattern2 = re.compile(r"stat_redo_bytes:\s*([0-9.]+)")
+    extract_pattern3 = re.compile(r"fallback_cnt_total:\s*([0-9.]+)")
 
     results = {}
     impl = "spp"
-    for dataset in DATASET_MAP.keys():
-        res_stdout, _ = run(
-            test_mode="B",
-            dataset=dataset,
-            impl=impl,
-            threads=16,
-            runs=0,
-            build="build/stat",
-        )
-        with open(f"./artifact/log/cost_breakdown_spec/{dataset}.txt", "w") as f:
-            f.write(res_stdout)
-        m = extract_pattern.search(res_stdout)
-        if not m:
-            raise RuntimeError("visited_byte_cnt_total not found in stdout")
-        m2 = extract_pattern2.search(res_stdout)
-        if not m2:
-            raise RuntimeError("stat_redo_bytes not found in stdout")
-
-        results[dataset] = {
-            "visited_byte_cnt_total": int(m.group(1)),
-            "stat_redo_bytes": int(m2.group(1)),
-        }
+    # the second pass reorders the candidates at run time, to count the fallbacks it removes
+    for adaptive_candidates in [0, 1]:
+        for dataset in DATASET_MAP.keys():
+            res_stdout, _ = run(
+                test_mode="B",
+                dataset=dataset,
+                impl=impl,
+                threads=16,
+                runs=0,
+                build="build/stat",
+                adaptive_candidates=adaptive_candidates,
+            )
+            suffix = "_adaptive" if adaptive_candidates else ""
+            with open(f"./artifact/log/cost_breakdown_spec/{dataset}{suffix}.txt", "w") as f:
+                f.write(res_stdout)
+            m = extract_pattern.search(res_stdout)
+            if not m:
+                raise RuntimeError("visited_byte_cnt_total not found in stdout")
+            m2 = extract_pattern2.search(res_stdout)
+            if not m2:
+                raise RuntimeError("stat_redo_bytes not found in stdout")
+            m3 = extract_pattern3.search(res_stdout)
+            if not m3:
+                raise RuntimeError("fallback_cnt_total not found in stdout")
+
+            results.setdefault(adaptive_candidates, {})[dataset] = {
+                "visited_byte_cnt_total": int(m.group(1)),
+                "stat_redo_bytes": int(m2.group(1)),
+                "fallback_cnt_total": int(m3.group(1)),
+            }
 
     with open("./artifact/result/cost_breakdown_spec.csv", "w") as f:
         writer = csv.writer(f)
         writer.writerow([""] + [DATASET_MAP[dataset] for dataset in DATASET_MAP.keys()])
-        writer.writerow(["Processed"] + [results[dataset]["visited_byte_cnt_total"] for dataset in DATASET_MAP.keys()])
-        writer.writerow(["Redo"] + [results[dataset]["stat_redo_bytes"] for dataset in DATASET_MAP.keys()])
+        writer.writerow(["Processed"] + [results[0][dataset]["visited_byte_cnt_total"] for dataset in DATASET_MAP.keys()])
+        writer.writerow(["Redo"] + [results[0][dataset]["stat_redo_bytes"] for dataset in DATASET_MAP.keys()])
+        writer.writerow(["Fallbacks"] + [results[0][dataset]["fallback_cnt_total"] for dataset in DATASET_MAP.keys()])
+        writer.writerow(["Processed (adaptive)"] + [results[1][dataset]["visited_byte_cnt_total"] for dataset in DATASET_MAP.keys()])
+        writer.writerow(["Redo (adaptive)"] + [results[1][dataset]["stat_redo_bytes"] for dataset in DATASET_MAP.keys()])
+        writer.writerow(["Fallbacks (adaptive)"] + [results[1][dataset]["fallback_cnt_total"] for dataset in DATASET_MAP.keys()])
+
+def run_spp_chunking():
+    os.makedirs("./artifact/log/spp_chunking", exist_ok=True)
+
+    results = {}
+    impl = "spp"
+    for schedule in ["static", "dynamic"]:
+        for chunks_per_thread in [1, 2, 4, 8, 16]:
+            key = f"{schedule}_{chunks_per_thread}"
+            for dataset in DATASET_MAP.keys():
+                res = benchmark(
+                    f"./artifact/log/spp_chunking/{key}_{dataset}.txt",
+                    dataset=dataset,
+                    impl=impl,
+                    threads=16,
+                    runs=5,
+                    chunks_per_thread=chunks_per_thread,
+                    schedule=schedule,
+                )
+                results.setdefault(key, {})[dataset] = round(res["mean"], 3)
+
+    with open("./artifact/result/spp_chunking.csv", "w") as f:
+        writer = csv.writer(f)
+        writer.writerow([""] + [DATASET_MAP[dataset] for dataset in DATASET_MAP.keys()])
+        for key in results.keys():
+            writer.writerow([key] + [results[key][dataset] for dataset in DATASET_MAP.keys()])
+
+# (name, io, io_sequential, io_huge_pages)
+IO_STRATEGIES = [
+    ("mmap", "mmap", 0, 0),
+    ("mmap_sequential", "mmap", 1, 0),
+    ("populate", "populate", 0, 0),
+    ("prefault", "prefault", 0, 0),
+    ("pread", "pread", 0, 0),
+    ("pread_huge_pages", "pread", 0, 1),
+]
+
+def run_io_modes():
+    """SPP with every way of reading the input, warm and cold page cache reported apart"""
+    os.makedirs("./artifact/log/io_modes", exist_ok=True)
+
+    results = {}
+    for name, io, io_sequential, io_huge_pages in IO_STRATEGIES:
+        for dataset in DATASET_MAP.keys():
+            res = benchmark(
+                f"./artifact/log/io_modes/{name}_{dataset}.txt",
+                dataset=dataset,
+                impl="spp",
+                threads=16,
+                runs=5,
+                io=io,
+                io_sequential=io_sequential,
+                io_huge_pages=io_huge_pages,
+                cold_runs=3,
+            )
+            results.setdefault(f"{name}_warm", {})[dataset] = round(res["mean"], 3)
+            results.setdefault(f"{name}_cold", {})[dataset] = round(res["cold_mean"], 3)
+
+    with open("./artifact/result/io_modes.csv", "w") as f:
+        writer = csv.writer(f)
+        writer.writerow([""] + [DATASET_MAP[dataset] for dataset in DATASET_MAP.keys()])
+        for key in results.keys():
+            writer.writerow([key] + [results[key][dataset] for dataset in DATASET_MAP.keys()])
+
+def write_synthetic_schema(desc_path, num_messages, seed=0):
+    """
+    Writes the descriptor set of a synthetic schema: a random tree of num_messages messages
+    with scalar, string and packed fields, where some messages also refer back to an
+    earlier message (recursion) or to a message of another branch (shared types).
+    """
+    import random
+    from google.protobuf import descriptor_pb2
+
+    FieldProto = descriptor_pb2.FieldDescriptorProto
+    scalar_types = [FieldProto.TYPE_INT32, FieldProto.TYPE_INT64, FieldProto.TYPE_UINT64,
+                    FieldProto.TYPE_BOOL, FieldProto.TYPE_DOUBLE, FieldProto.TYPE_FLOAT]
+
+    rng = random.Random(seed)
+    fds = descriptor_pb2.FileDescriptorSet()
+    file_desc = fds.file.add(name=os.path.basename(desc_path).replace(".desc", ".proto"),
+                             package="PB", syntax="proto3")
+    msgs = [file_desc.message_type.add(name=f"M{i}") for i in range(num_messages)]
+
+    def add_field(msg, type, repeated=False, type_name=None):
+        number = len(msg.field) + 1
+        field = msg.field.add(name=f"f{number}", number=number, type=type,
+                              label=FieldProto.LABEL_REPEATED if repeated else FieldProto.LABEL_OPTIONAL)
+        if type_name:
+            field.type_name = f".PB.{type_name}"
+
+    for i, msg in enumerate(msgs):
+        for _ in range(rng.randint(2, 8)):
+            add_field(msg, rng.choice(scalar_types))
+        add_field(msg, FieldProto.TYPE_STRING, repeated=rng.random() < 0.3)
+        add_field(msg, rng.choice(scalar_types[:3]), repeated=True)
+        if i > 0:
+            add_field(msgs[rng.randrange(i)], FieldProto.TYPE_MESSAGE, rng.random() < 0.5, msg.name)
+        if i > 0 and rng.random() < 0.1:
+            add_field(msg, FieldProto.TYPE_MESSAGE, True, msgs[rng.randrange(i)].name)
+
+    with open(desc_path, "wb") as f:
+        f.write(fds.SerializeToString())
+
+# generator_scalability: the SPP header may grow by at most this factor in bytes per message
+# from the smallest to the largest schema, i.e., its size stays roughly linear
+MAX_HEADER_BYTES_PER_MESSAGE_GROWTH = 2.0
+
+def run_generator_scalability():
+    """generation time and size of the SPP tables over synthetic schemas of growing size"""
+    import time
+
+    os.makedirs("./artifact/generated", exist_ok=True)
+    os.makedirs("./artifact/result", exist_ok=True)
+
+    env = copy.deepcopy(os.environ)
+    env["PYTHONPATH"] = "./src"
+
+    with open("./artifact/result/generator_scalability.csv", "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(["messages", "generation_time", "spp_header_bytes", "bytes_per_message"])
+        bytes_per_message = []
+        for num_messages in [125, 250, 500, 1000, 2000, 4000]:
+            prefix = f"synth_schema_{num_messages}"
+            write_synthetic_schema(f"./artifact/generated/{prefix}.desc", num_messages)
+
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-m", "pbdecoder_gen.gen_from_proto", f"./schema/{prefix}.proto"],
+                           env=env, check=True, capture_output=True, text=True)
+            elapsed = time.perf_counter() - start
+
+            header_bytes = os.path.getsize(f"./artifact/generated/{prefix}.spp.h")
+            bytes_per_message.append(header_bytes / num_messages)
+            print(f"[GEN] messages={num_messages} generation_time={elapsed:.2f}s spp_header_bytes={header_bytes} "
+                  f"bytes_per_message={bytes_per_message[-1]:.0f}")
+            writer.writerow([num_messages, round(elapsed, 2), header_bytes, round(bytes_per_message[-1])])
+
+    growth = bytes_per_message[-1] / bytes_per_message[0]
+    if growth > MAX_HEADER_BYTES_PER_MESSAGE_GROWTH:
+        raise RuntimeError(f"the SPP header grows faster than linearly: {growth:.2f}x bytes per message")
+
+def generate_synthetic_dataset(schema, dataset, size_mb, **shape):
+    """
+    Writes ./dataset/<dataset>.pb with pbdecoder_gen.gen_dataset unless it exists; shape holds
+    its options (repeat, string_length, ambiguity, max_depth, ...).
+    """
+    path = f"./dataset/{dataset}.pb"
+    if os.path.exists(path):
+        return path
+
+    env = copy.deepcopy(os.environ)
+    env["PYTHONPATH"] = "./src"
+    cmd = [sys.executable, "-m", "pbdecoder_gen.gen_dataset", f"./schema/{schema}.proto",
+           f"--size={size_mb}MB", f"--out={path}", f"--workers={os.cpu_count()}"]
+    cmd += [f"--{key}={value}" for key, value in shape.items()]
+    print(f"[GEN] {' '.join(cmd)}")
+    subprocess.run(cmd, env=env, check=True, capture_output=True, text=True)
+    return path
+
+# every schema of the evaluation datasets
+SYNTHETIC_SCHEMAS = sorted({DATASET_TO_SCHEMA[dataset] for dataset in DATASET_MAP.keys()})
+
+def run_synthetic_over_size():
+    """SPP time over generated inputs of growing size, for every schema"""
+    os.makedirs("./artifact/log/synthetic_over_size", exist_ok=True)
+
+    impl = "spp"
+    # below 4 GiB: the elements of twitter_stream sit in a nested message, whose length is 32-bit
+    sizes = [64, 256, 1024, 3072]
+    results = {}
+    for schema in SYNTHETIC_SCHEMAS:
+        for size in sizes:
+            dataset = f"{schema}_synth_{size}MB"
+            generate_synthetic_dataset(schema, dataset, size)
+            res = benchmark(
+                f"./artifact/log/synthetic_over_size/{impl}_{dataset}.txt",
+                dataset=dataset,
+                schema=schema,
+                impl=impl,
+                threads=16,
+                runs=5,
+            )
+            results.setdefault(schema, {})[size] = round(res["mean"], 3)
+
+    with open("./artifact/result/synthetic_over_size.csv", "w") as f:
+        writer = csv.writer(f)
+        writer.writerow([""] + sizes)
+        for schema in results.keys():
+            writer.writerow([schema] + [results[schema][size] for size in sizes])
+
+def run_synthetic_over_shape():
+    """
+    BL and SPP time over generated inputs of one size, varying one shape parameter at a
+    time from the generator's defaults. The inputs are removed once measured.
+    """
+    os.makedirs("./artifact/log/synthetic_over_shape", exist_ok=True)
+
+    size = 256
+    shapes = {
+        "string_length": [4, 16, 64, 256],
+        "repeat": [1, 4, 16],
+        "ambiguity": [0, 0.5, 1],
+        "max_depth": [1, 2, 4, 8],
+    }
+    with open("./artifact/result/synthetic_over_shape.csv", "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(["schema", "parameter", "value", "bl", "spp"])
+        for schema in SYNTHETIC_SCHEMAS:
+            for parameter, values in shapes.items():
+                for value in values:
+                    dataset = f"{schema}_synth_{parameter}_{value}"
+                    path = generate_synthetic_dataset(schema, dataset, size, **{parameter: value})
+                    times = {}
+                    for impl in ["bl", "spp"]:
+                        res = benchmark(
+                            f"./artifact/log/synthetic_over_shape/{impl}_{dataset}.txt",
+                            dataset=dataset,
+                            schema=schema,
+                            impl=impl,
+                            threads=1 if impl == "bl" else 16,
+                            runs=5,
+                        )
+                        times[impl] = round(res["mean"], 3)
+                    os.remove(path)
+                    writer.writerow([schema, parameter, value, times["bl"], times["spp"]])
 
 def run_experiment(experiment):
     if experiment == "overall_execution_time":
@@ -366,6 +618,16 @@ def run_experiment(experiment):
         run_cost_breakdown_spec()
     elif experiment == "memory_overhead_over_threads":
         run_memory_overhead_over_threads()
+    elif experiment == "spp_chunking":
+        run_spp_chunking()
+    elif experiment == "generator_scalability":
+        run_generator_scalability()
+    elif experiment == "synthetic_over_size":
+        run_synthetic_over_size()
+    elif experiment == "synthetic_over_shape":
+        run_synthetic_over_shape()
+    elif experiment == "io_modes":
+        run_io_modes()
     else:
         raise ValueError(f"Unknown experiment: {experiment}")
 
@@ -380,12 +642,39 @@ def main():
         "scalability_over_size",
         "cost_breakdown_spec",
         "memory_overhead_over_threads",
+        "spp_chunking",
+        "generator_scalability",
+        "synthetic_over_size",
+        "synthetic_over_shape",
+        "io_modes",
     ])
     ap.add_argument("--test_mode", choices=["C", "B"])
     ap.add_argument("--dataset")
-    ap.add_argument("--impl", choices=["gg", "bl", "tpp", "spp"])
+    ap.add_argument("--schema", default=None, help="schema of the dataset, if not in DATASET_TO_SCHEMA")
+    ap.add_argument("--impl", choices=["gg", "bl", "tpp", "spp", "auto"])
     ap.add_argument("--runs", type=int, default=5)
     ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--simd", choices=["auto", "avx2", "sse4", "scalar"], default="auto")
+    ap.add_argument("--build", default="build")
+    ap.add_argument("--malloc", choices=["mimalloc", "system"], default="mimalloc")
+    ap.add_argument("--chunks_per_thread", type=int, default=1)
+    ap.add_argument("--min_chunk_size", type=int, default=0)
+    ap.add_argument("--schedule", choices=["static", "dynamic"], default="static")
+    ap.add_argument("--pipeline_merge", type=int, choices=[0, 1], default=1)
+    ap.add_argument("--input_format", choices=["message", "delimited", "batch"], default="message")
+    ap.add_argument("--columnar", type=int, choices=[0, 1], default=0)
+    ap.add_argument("--to_pb", type=int, choices=[0, 1], default=0)
+    ap.add_argument("--adaptive_candidates", type=int, choices=[0, 1], default=0)
+    ap.add_argument("--filter_starts", type=int, choices=[0, 1], default=1)
+    ap.add_argument("--metrics_json", default=None)
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--results_json", default=None)
+    ap.add_argument("--cost_model", default=None, help="coefficients for --impl auto (see experiment.calibrate)")
+    ap.add_argument("--reuse_context", type=int, choices=[0, 1], default=0)
+    ap.add_argument("--io", choices=["mmap", "populate", "prefault", "pread"], default="mmap")
+    ap.add_argument("--io_sequential", type=int, choices=[0, 1], default=0)
+    ap.add_argument("--io_huge_pages", type=int, choices=[0, 1], default=0)
+    ap.add_argument("--cold_runs", type=int, default=0, help="extra runs, each after dropping the input from the page cache")
     args = ap.parse_args()
 
     if args.experiment:
@@ -398,6 +687,28 @@ def main():
         impl=args.impl,
         threads=args.threads,
         runs=args.runs,
+        simd=args.simd,
+        build=args.build,
+        malloc=args.malloc,
+        chunks_per_thread=args.chunks_per_thread,
+        min_chunk_size=args.min_chunk_size,
+        schedule=args.schedule,
+        pipeline_merge=args.pipeline_merge,
+        input_format=args.input_format,
+        columnar=args.columnar,
+        to_pb=args.to_pb,
+        adaptive_candidates=args.adaptive_candidates,
+        filter_starts=args.filter_starts,
+        metrics_json=args.metrics_json,
+        warmup=args.warmup,
+        results_json=args.results_json,
+        schema=args.schema,
+        cost_model=args.cost_model,
+        reuse_context=args.reuse_context,
+        io=args.io,
+        io_sequential=args.io_sequential,
+        io_huge_pages=args.io_huge_pages,
+        cold_runs=args.cold_runs,
     )
 
 if __name__ == "__main__":
@@ -33,6 +33,7 @@ if [ ! -f "$ABSEIL_PREFIX/lib/cmake/absl/abslConfig.cmake" ]; then
     -DCMAKE_BUILD_TYPE=Release \
     -DCMAKE_INSTALL_PREFIX="$ABSEIL_PREFIX" \
     -DCMAKE_CXX_STANDARD=17 \
+    -DCMAKE_POSITION_INDEPENDENT_CODE=ON \
     -DABSL_PROPAGATE_CXX_STD=ON \
     -DABSL_ENABLE_INSTALL=ON
   cmake --build build --parallel 4
@@ -58,6 +59,7 @@ cmake -S . -B build \
   -DCMAKE_BUILD_TYPE=Release \
   -DCMAKE_INSTALL_PREFIX="$PREFIX" \
   -Dprotobuf_BUILD_TESTS=OFF \
+  -DCMAKE_POSITION_INDEPENDENT_CODE=ON \
   -Dprotobuf_ABSL_PROVIDER=package \
   -DCMAKE_PREFIX_PATH="$ABSEIL_PREFIX"
 
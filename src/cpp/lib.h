@@ -7,14 +7,27 @@
 #include <omp.h>
 #include <sys/mman.h>
 #include <sys/stat.h>
+#include <unistd.h>
 
+#include <algorithm>
+#include <atomic>
 #include <cassert>
+#include <cerrno>
+#include <cmath>
+#include <condition_variable>
 #include <cstring>
 #include <deque>
+#include <fstream>
 #include <initializer_list>
 #include <iostream>
+#include <limits>
 #include <map>
+#include <memory>
+#include <mutex>
 #include <string>
+#include <string_view>
+#include <thread>
+#include <type_traits>
 #include <vector>
 
 #include "get_time.h"
@@ -33,42 +46,599 @@
 
 const size_t padding = 10;
 
-struct Buffer {
-    uint8_t* buffer;
-    size_t size;
+// Byte offsets into the input. 32-bit offsets keep IR/TagInfo small and are used by
+// default; compile with -DLARGE_INPUT to decode inputs of 4 GiB and more.
+#ifdef LARGE_INPUT
+using offset_t = uint64_t;
+#else
+using offset_t = uint32_t;
+#endif
 
-    Buffer(std::string& filename) {
-        int fd = open(filename.c_str(), O_RDONLY);
+// The slot of tag in a displacement perfect hash of 2^bits slots, for tags that no small modulus
+// separates (gen_const.construct_displaced_hash): the bucket tag % buckets displaces the tag
+// before a multiplicative hash.
+inline uint32_t DisplacedHash(uint32_t tag, const uint32_t* displace, uint32_t buckets, uint32_t bits) {
+    return ((tag ^ displace[tag % buckets]) * 0x9E3779B1u) >> (32 - bits);
+}
 
-        if (fd == -1) {
-            THROW_RUNTIME_ERROR("file open failed");
+// SIMD kernels used by the packed-field decoders, selected once at runtime.
+enum class SimdLevel { SCALAR = 0, SSE4 = 1, AVX2 = 2 };
+
+inline SimdLevel DetectSimdLevel() {
+    __builtin_cpu_init();
+    if (__builtin_cpu_supports("avx2")) return SimdLevel::AVX2;
+    if (__builtin_cpu_supports("sse4.1")) return SimdLevel::SSE4;
+    return SimdLevel::SCALAR;
+}
+
+// can be overridden (e.g., --simd=scalar) to measure the gain of the SIMD kernels
+inline SimdLevel& ActiveSimdLevel() {
+    static SimdLevel level = DetectSimdLevel();
+    return level;
+}
+
+inline const char* SimdLevelName(SimdLevel level) {
+    switch (level) {
+        case SimdLevel::AVX2:
+            return "avx2";
+        case SimdLevel::SSE4:
+            return "sse4";
+        default:
+            return "scalar";
+    }
+}
+
+// a requested level above what the CPU supports falls back to the detected one, since
+// running its kernels would fault with SIGILL
+inline SimdLevel ParseSimdLevel(const std::string& name) {
+    SimdLevel detected = DetectSimdLevel();
+    SimdLevel requested = detected;
+    if (name == "avx2") requested = SimdLevel::AVX2;
+    if (name == "sse4") requested = SimdLevel::SSE4;
+    if (name == "scalar") requested = SimdLevel::SCALAR;
+    if (requested > detected) {
+        std::cerr << "warning: the CPU does not support --simd=" << name << ", using "
+                  << SimdLevelName(detected) << "\n";
+        return detected;
+    }
+    return requested;
+}
+
+namespace simd {
+
+// the number of bytes in [p, p + n) that terminate a varint, i.e., MSB is 0
+inline uint32_t CountVarintTerminatorsScalar(const uint8_t* p, uint32_t n) {
+    uint32_t cnt = 0;
+    for (uint32_t i = 0; i < n; i++) {
+        cnt += p[i] < 0x80;
+    }
+    return cnt;
+}
+
+__attribute__((target("sse4.1,popcnt"))) inline uint32_t CountVarintTerminatorsSSE4(
+    const uint8_t* p, uint32_t n) {
+    uint32_t cnt = 0, i = 0;
+    for (; i + 16 <= n; i += 16) {
+        __m128i v = _mm_loadu_si128(reinterpret_cast<const __m128i*>(p + i));
+        cnt += 16 - _mm_popcnt_u32(_mm_movemask_epi8(v));
+    }
+    return cnt + CountVarintTerminatorsScalar(p + i, n - i);
+}
+
+__attribute__((target("avx2,popcnt"))) inline uint32_t CountVarintTerminatorsAVX2(
+    const uint8_t* p, uint32_t n) {
+    uint32_t cnt = 0, i = 0;
+    for (; i + 32 <= n; i += 32) {
+        __m256i v = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(p + i));
+        cnt += 32 - _mm_popcnt_u32(_mm256_movemask_epi8(v));
+    }
+    return cnt + CountVarintTerminatorsSSE4(p + i, n - i);
+}
+
+inline uint32_t CountVarintTerminators(const uint8_t* p, uint32_t n) {
+    switch (ActiveSimdLevel()) {
+        case SimdLevel::AVX2:
+            return CountVarintTerminatorsAVX2(p, n);
+        case SimdLevel::SSE4:
+            return CountVarintTerminatorsSSE4(p, n);
+        default:
+            return CountVarintTerminatorsScalar(p, n);
+    }
+}
+
+// Decodes one varint at p[curr] the same way as ByteStream::readVarint64 does
+// (at most 10 bytes); the value is truncated to T.
+template <typename T>
+inline T DecodeOneVarint(const uint8_t* p, offset_t& curr) {
+    uint64_t val = 0;
+    for (int i = 0; i < 10; i++) {
+        uint64_t b = p[curr++];
+        val |= (b & 0x7f) << (7 * i);
+        if (b < 0x80) break;
+    }
+    return static_cast<T>(val);
+}
+
+// Decodes varints starting at p[curr] while curr < end and at most `cnt` values into out.
+// Returns the number of decoded values.
+template <typename T>
+inline uint32_t DecodeVarintsScalar(const uint8_t* p, offset_t& curr, offset_t end, T* out,
+                                    uint32_t cnt) {
+    uint32_t i = 0;
+    while (i < cnt and curr < end) {
+        if (p[curr] < 0x80) {
+            out[i++] = static_cast<T>(p[curr++]);
+        } else {
+            out[i++] = DecodeOneVarint<T>(p, curr);
         }
+    }
+    return i;
+}
 
-        struct stat sb;
-        if (fstat(fd, &sb) == -1) {
-            THROW_RUNTIME_ERROR("fstate failed");
+// Widens 16 single-byte varints from p into out.
+template <typename T>
+__attribute__((target("sse4.1"))) inline void WidenBytesSSE4(const uint8_t* p, T* out) {
+    __m128i v = _mm_loadu_si128(reinterpret_cast<const __m128i*>(p));
+    if (sizeof(T) == 4) {
+        for (int k = 0; k < 4; k++) {
+            _mm_storeu_si128(reinterpret_cast<__m128i*>(out) + k, _mm_cvtepu8_epi32(v));
+            v = _mm_srli_si128(v, 4);
         }
-        this->size = sb.st_size;
+    } else {
+        for (int k = 0; k < 8; k++) {
+            _mm_storeu_si128(reinterpret_cast<__m128i*>(out) + k, _mm_cvtepu8_epi64(v));
+            v = _mm_srli_si128(v, 2);
+        }
+    }
+}
 
-        this->buffer =
-            static_cast<uint8_t*>(mmap(NULL, this->size + padding, PROT_READ, MAP_PRIVATE, fd, 0u));
-        if (this->buffer == MAP_FAILED) {
-            THROW_RUNTIME_ERROR("mmap failed");
+// Widens 32 single-byte varints from p into out.
+template <typename T>
+__attribute__((target("avx2"))) inline void WidenBytesAVX2(const uint8_t* p, T* out) {
+    if (sizeof(T) == 4) {
+        for (int k = 0; k < 4; k++) {
+            __m128i v = _mm_loadl_epi64(reinterpret_cast<const __m128i*>(p + 8 * k));
+            _mm256_storeu_si256(reinterpret_cast<__m256i*>(out) + k, _mm256_cvtepu8_epi32(v));
+        }
+    } else {
+        for (int k = 0; k < 8; k++) {
+            int32_t word;
+            memcpy(&word, p + 4 * k, sizeof(word));
+            __m128i v = _mm_cvtsi32_si128(word);
+            _mm256_storeu_si256(reinterpret_cast<__m256i*>(out) + k, _mm256_cvtepu8_epi64(v));
+        }
+    }
+}
+
+// Vectorized decoding: a block of bytes without continuation bits is a run of one-byte
+// varints (the common case for ids and small counters), which are widened at once.
+// Otherwise only the run before the first continuation byte is kept (the rest is
+// overwritten later) and the multi-byte varint is decoded by the scalar path.
+template <typename T>
+__attribute__((target("sse4.1"))) inline uint32_t DecodeVarintsSSE4(const uint8_t* p,
+                                                                    offset_t& curr, offset_t end,
+                                                                    T* out, uint32_t cnt) {
+    uint32_t i = 0;
+    while (i + 16 <= cnt and curr + 16 <= end) {
+        __m128i v = _mm_loadu_si128(reinterpret_cast<const __m128i*>(p + curr));
+        uint32_t mask = _mm_movemask_epi8(v);
+        WidenBytesSSE4(p + curr, out + i);
+        if (mask == 0) {
+            i += 16;
+            curr += 16;
+            continue;
+        }
+        uint32_t run = __builtin_ctz(mask);
+        i += run;
+        curr += run;
+        out[i++] = DecodeOneVarint<T>(p, curr);
+    }
+    return i + DecodeVarintsScalar(p, curr, end, out + i, cnt - i);
+}
+
+template <typename T>
+__attribute__((target("avx2"))) inline uint32_t DecodeVarintsAVX2(const uint8_t* p, offset_t& curr,
+                                                                  offset_t end, T* out,
+                                                                  uint32_t cnt) {
+    uint32_t i = 0;
+    while (i + 32 <= cnt and curr + 32 <= end) {
+        __m256i v = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(p + curr));
+        uint32_t mask = _mm256_movemask_epi8(v);
+        WidenBytesAVX2(p + curr, out + i);
+        if (mask == 0) {
+            i += 32;
+            curr += 32;
+            continue;
+        }
+        uint32_t run = __builtin_ctz(mask);
+        i += run;
+        curr += run;
+        out[i++] = DecodeOneVarint<T>(p, curr);
+    }
+    return i + DecodeVarintsSSE4(p, curr, end, out + i, cnt - i);
+}
+
+template <typename T>
+inline uint32_t DecodeVarints(const uint8_t* p, offset_t& curr, offset_t end, T* out,
+                              uint32_t cnt) {
+    switch (ActiveSimdLevel()) {
+        case SimdLevel::AVX2:
+            return DecodeVarintsAVX2(p, curr, end, out, cnt);
+        case SimdLevel::SSE4:
+            return DecodeVarintsSSE4(p, curr, end, out, cnt);
+        default:
+            return DecodeVarintsScalar(p, curr, end, out, cnt);
+    }
+}
+
+// A set of byte values laid out for a nibble lookup: bit (b >> 4) & 7 of row_lo[b & 15]
+// (of row_hi[b & 15] if b >= 0x80) tells whether b is in the set.
+struct ByteSet {
+    uint8_t row_lo[16];
+    uint8_t row_hi[16];
+
+    inline bool Contains(uint8_t b) const {
+        return ((b < 0x80 ? row_lo : row_hi)[b & 15] >> ((b >> 4) & 7)) & 1;
+    }
+};
+
+// the index of the first byte of [p, p + n) in the set, or n
+inline offset_t FindInByteSetScalar(const uint8_t* p, offset_t n, const ByteSet& set) {
+    for (offset_t i = 0; i < n; i++) {
+        if (set.Contains(p[i])) return i;
+    }
+    return n;
+}
+
+// bit i is set if p[i] is in the set, for 16 bytes
+__attribute__((target("sse4.1"))) inline uint32_t MatchByteSetSSE4(const uint8_t* p,
+                                                                  const ByteSet& set) {
+    __m128i v = _mm_loadu_si128(reinterpret_cast<const __m128i*>(p));
+    __m128i lo_nibble = _mm_and_si128(v, _mm_set1_epi8(0x0f));
+    __m128i row_lo = _mm_shuffle_epi8(_mm_loadu_si128(reinterpret_cast<const __m128i*>(set.row_lo)), lo_nibble);
+    __m128i row_hi = _mm_shuffle_epi8(_mm_loadu_si128(reinterpret_cast<const __m128i*>(set.row_hi)), lo_nibble);
+    __m128i row = _mm_blendv_epi8(row_lo, row_hi, v);  // by the MSB of each byte
+    __m128i hi_nibble = _mm_and_si128(_mm_srli_epi16(v, 4), _mm_set1_epi8(0x07));
+    __m128i bit = _mm_shuffle_epi8(_mm_setr_epi8(1, 2, 4, 8, 16, 32, 64, -128, 1, 2, 4, 8, 16, 32, 64, -128), hi_nibble);
+    return _mm_movemask_epi8(_mm_cmpeq_epi8(_mm_and_si128(row, bit), bit));
+}
+
+// bit i is set if p[i] is in the set, for 32 bytes
+__attribute__((target("avx2"))) inline uint32_t MatchByteSetAVX2(const uint8_t* p,
+                                                                const ByteSet& set) {
+    __m256i v = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(p));
+    __m256i lo_nibble = _mm256_and_si256(v, _mm256_set1_epi8(0x0f));
+    __m256i row_lo = _mm256_shuffle_epi8(_mm256_broadcastsi128_si256(_mm_loadu_si128(reinterpret_cast<const __m128i*>(set.row_lo))), lo_nibble);
+    __m256i row_hi = _mm256_shuffle_epi8(_mm256_broadcastsi128_si256(_mm_loadu_si128(reinterpret_cast<const __m128i*>(set.row_hi))), lo_nibble);
+    __m256i row = _mm256_blendv_epi8(row_lo, row_hi, v);
+    __m256i hi_nibble = _mm256_and_si256(_mm256_srli_epi16(v, 4), _mm256_set1_epi8(0x07));
+    __m256i bit = _mm256_shuffle_epi8(_mm256_setr_epi8(1, 2, 4, 8, 16, 32, 64, -128, 1, 2, 4, 8, 16, 32, 64, -128,
+                                                       1, 2, 4, 8, 16, 32, 64, -128, 1, 2, 4, 8, 16, 32, 64, -128), hi_nibble);
+    return _mm256_movemask_epi8(_mm256_cmpeq_epi8(_mm256_and_si256(row, bit), bit));
+}
+
+__attribute__((target("sse4.1"))) inline offset_t FindInByteSetSSE4(const uint8_t* p, offset_t n,
+                                                                   const ByteSet& set) {
+    offset_t i = 0;
+    for (; i + 16 <= n; i += 16) {
+        uint32_t mask = MatchByteSetSSE4(p + i, set);
+        if (mask) return i + __builtin_ctz(mask);
+    }
+    return i + FindInByteSetScalar(p + i, n - i, set);
+}
+
+__attribute__((target("avx2"))) inline offset_t FindInByteSetAVX2(const uint8_t* p, offset_t n,
+                                                                 const ByteSet& set) {
+    offset_t i = 0;
+    for (; i + 32 <= n; i += 32) {
+        uint32_t mask = MatchByteSetAVX2(p + i, set);
+        if (mask) return i + __builtin_ctz(mask);
+    }
+    return i + FindInByteSetSSE4(p + i, n - i, set);
+}
+
+inline offset_t FindInByteSet(const uint8_t* p, offset_t n, const ByteSet& set) {
+    switch (ActiveSimdLevel()) {
+        case SimdLevel::AVX2:
+            return FindInByteSetAVX2(p, n, set);
+        case SimdLevel::SSE4:
+            return FindInByteSetSSE4(p, n, set);
+        default:
+            return FindInByteSetScalar(p, n, set);
+    }
+}
+
+}  // namespace simd
+
+// Arena mode (compile with -DARENA): messages, speculative values, repeated fields and
+// strings of a decode result are bump-allocated from one arena per thread and released
+// together by ArenaPool, so neither allocation nor teardown walks the message tree.
+class Arena {
+   public:
+    static constexpr size_t MIN_BLOCK_SIZE = 64 << 10;
+    static constexpr size_t MAX_BLOCK_SIZE = 64 << 20;
+
+    Arena() : curr(0), end(0), block_size(MIN_BLOCK_SIZE), allocated_bytes(0) {}
+    Arena(const Arena&) = delete;
+    Arena& operator=(const Arena&) = delete;
+    ~Arena() { Release(); }
+
+    inline void* Allocate(size_t size, size_t align) {
+        uintptr_t p = (curr + align - 1) & ~(uintptr_t)(align - 1);
+        if (p + size > end) {
+            NewBlock(size + align);
+            p = (curr + align - 1) & ~(uintptr_t)(align - 1);
+        }
+        curr = p + size;
+        return reinterpret_cast<void*>(p);
+    }
+
+    void Release() {
+        for (auto block : blocks) free(block);
+        blocks.clear();
+        curr = end = 0;
+        block_size = MIN_BLOCK_SIZE;
+        allocated_bytes = 0;
+    }
+
+    // frees everything but the last (largest) block, which is reused by the next decode
+    void Reset() {
+        if (blocks.empty()) return;
+        void* last = blocks.back();
+        size_t last_size = end - reinterpret_cast<uintptr_t>(last);
+        blocks.pop_back();
+        for (auto block : blocks) free(block);
+        blocks.assign(1, last);
+        curr = reinterpret_cast<uintptr_t>(last);
+        allocated_bytes = last_size;
+    }
+
+    size_t AllocatedBytes() const { return allocated_bytes; }
+
+   private:
+    void NewBlock(size_t min_size) {
+        size_t size = std::max(block_size, min_size);
+        void* block = malloc(size);
+        if (block == nullptr) {
+            THROW_RUNTIME_ERROR("arena allocation failed");
         }
+        blocks.push_back(block);
+        curr = reinterpret_cast<uintptr_t>(block);
+        end = curr + size;
+        allocated_bytes += size;
+        block_size = std::min(block_size * 2, MAX_BLOCK_SIZE);
+    }
+
+    std::vector<void*> blocks;
+    uintptr_t curr, end;
+    size_t block_size;
+    size_t allocated_bytes;
+};
+
+// One Arena per thread; all of them are released when the pool is destroyed.
+class ArenaPool {
+   public:
+    ArenaPool() : id(NextId()) {}
+    ArenaPool(const ArenaPool&) = delete;
+    ArenaPool& operator=(const ArenaPool&) = delete;
+
+    // the arena of the calling thread (OpenMP workers included); a thread gets one arena per
+    // pool, also when it alternates between pools
+    inline Arena* Local() {
+        // pool ids are never reused, so the cache never matches a destroyed pool
+        thread_local uint64_t cached_id = 0;
+        thread_local Arena* cached = nullptr;
+        if (cached_id != id) {
+            // the pool keeps the arena of each thread, so nothing outlives it on the thread side
+            std::lock_guard<std::mutex> lock(mu);
+            Arena*& arena = own[std::this_thread::get_id()];
+            if (arena == nullptr) {
+                arenas.emplace_back(new Arena());
+                arena = arenas.back().get();
+            }
+            cached = arena;
+            cached_id = id;
+        }
+        return cached;
+    }
+
+    // bulk release of the decode result; the threads keep (part of) their memory
+    void Reset() {
+        std::lock_guard<std::mutex> lock(mu);
+        for (auto& arena : arenas) arena->Reset();
+    }
+
+    size_t AllocatedBytes() {
+        std::lock_guard<std::mutex> lock(mu);
+        size_t total = 0;
+        for (auto& arena : arenas) total += arena->AllocatedBytes();
+        return total;
     }
-    ~Buffer() { assert(munmap(this->buffer, this->size + padding) == 0); }
+
+   private:
+    static uint64_t NextId() {
+        static std::atomic<uint64_t> next_id(1);
+        return next_id++;
+    }
+
+    uint64_t id;
+    std::mutex mu;
+    std::vector<std::unique_ptr<Arena>> arenas;
+    std::map<std::thread::id, Arena*> own;  // the arena of each thread in arenas
+};
+
+inline ArenaPool*& ActiveArenaPool() {
+    static ArenaPool* pool = nullptr;
+    return pool;
+}
+
+// Makes `pool` the allocation target of every thread until the scope ends.
+// It should be created outside of parallel regions.
+struct ArenaScope {
+    ArenaPool* prev;
+
+    ArenaScope(ArenaPool* pool) : prev(ActiveArenaPool()) { ActiveArenaPool() = pool; }
+    ~ArenaScope() { ActiveArenaPool() = prev; }
 };
 
+inline void* ArenaAllocate(size_t size, size_t align) {
+    ArenaPool* pool = ActiveArenaPool();
+    ASSERT_WITH_MSG(pool != nullptr, "no active ArenaPool");
+    return pool->Local()->Allocate(size, align);
+}
+
+template <typename T>
+struct ArenaAllocator {
+    using value_type = T;
+
+    ArenaAllocator() = default;
+    template <typename U>
+    ArenaAllocator(const ArenaAllocator<U>&) {}
+
+    T* allocate(size_t n) { return static_cast<T*>(ArenaAllocate(n * sizeof(T), alignof(T))); }
+    void deallocate(T*, size_t) {}  // released with the pool
+
+    template <typename U>
+    bool operator==(const ArenaAllocator<U>&) const { return true; }
+    template <typename U>
+    bool operator!=(const ArenaAllocator<U>&) const { return false; }
+};
+
+#ifdef ARENA
+template <typename T>
+using vector_t = std::vector<T, ArenaAllocator<T>>;
+using string_t = std::basic_string<char, std::char_traits<char>, ArenaAllocator<char>>;
+
+inline std::string ToStdString(string_t&& s) { return std::string(s.data(), s.size()); }
+#else
+template <typename T>
+using vector_t = std::vector<T>;
+using string_t = std::string;
+#endif
+
+inline std::string&& ToStdString(std::string&& s) { return std::move(s); }
+
+// used by the generated code to allocate/free messages and speculative values
+template <typename T>
+inline T* New() {
+#ifdef ARENA
+    return new (ArenaAllocate(sizeof(T), alignof(T))) T();
+#else
+    return new T();
+#endif
+}
+
+template <typename T>
+inline void Delete(T* val) {
+#ifdef ARENA
+    (void)val;  // released with the pool
+#else
+    delete val;
+#endif
+}
+
+
+// A string/bytes field that points into the input Buffer instead of owning a copy
+// (--zero_copy_strings). The decode result must keep the Buffer alive.
+// It provides the assign/append calls ByteStream uses on std::string: appending the bytes
+// that directly follow the view (a string split by SPP chunks) only extends the view;
+// any other append copies both parts into owned storage.
+class StringRef {
+   public:
+    StringRef() : ptr(nullptr), len(0), owned(false) {}
+    StringRef(const StringRef& other) : ptr(other.ptr), len(other.len), owned(false) {
+        if (other.owned) CopyFrom(other.ptr, other.len, nullptr, 0);
+    }
+    StringRef(StringRef&& other) noexcept : ptr(other.ptr), len(other.len), owned(other.owned) {
+        other.owned = false;
+    }
+    StringRef& operator=(const StringRef& other) {
+        if (this != &other) {
+            StringRef tmp(other);
+            *this = std::move(tmp);
+        }
+        return *this;
+    }
+    StringRef& operator=(StringRef&& other) noexcept {
+        if (this != &other) {
+            Free();
+            ptr = other.ptr;
+            len = other.len;
+            owned = other.owned;
+            other.owned = false;
+        }
+        return *this;
+    }
+    ~StringRef() { Free(); }
+
+    inline void assign(const char* p, size_t n) {
+        Free();
+        ptr = p;
+        len = n;
+    }
+
+    template <typename It>
+    inline void append(It first, It last) {
+        const char* p = reinterpret_cast<const char*>(&*first);
+        size_t n = last - first;
+        if (n == 0) return;
+        if (len == 0 and !owned) {
+            ptr = p;
+            len = n;
+        } else if (!owned and ptr + len == p) {
+            len += n;
+        } else {
+            CopyFrom(ptr, len, p, n);
+        }
+    }
+
+    inline const char* data() const { return ptr; }
+    inline size_t size() const { return len; }
+    inline bool empty() const { return len == 0; }
+    inline bool is_owned() const { return owned; }
+    inline std::string_view view() const { return std::string_view(ptr, len); }
+    inline operator std::string_view() const { return view(); }
+    inline std::string str() const { return std::string(ptr, len); }
+
+   private:
+    void CopyFrom(const char* p1, size_t n1, const char* p2, size_t n2) {
+#ifdef ARENA
+        char* dst = static_cast<char*>(ArenaAllocate(n1 + n2, 1));
+#else
+        char* dst = new char[n1 + n2];
+#endif
+        memcpy(dst, p1, n1);
+        if (n2 > 0) memcpy(dst + n1, p2, n2);
+        Free();
+        ptr = dst;
+        len = n1 + n2;
+        owned = true;
+    }
+
+    void Free() {
+#ifndef ARENA
+        if (owned) delete[] ptr;
+#endif
+        owned = false;
+    }
+
+    const char* ptr;
+    size_t len;
+    bool owned;
+};
+
+inline std::string ToStdString(StringRef&& s) { return s.str(); }
+
 #ifdef COUNT_TAG_BYTES
 extern uint32_t stat_tag_bytes;
 #endif
 
 struct ByteStream {
     uint8_t* buffer;
-    uint32_t curr;  // TODO should easily support int64
-    uint32_t end;
+    offset_t curr;
+    offset_t end;
 
-    ByteStream(uint8_t* buffer, uint32_t curr, uint32_t end)
+    ByteStream(uint8_t* buffer, offset_t curr, offset_t end)
         : buffer(buffer), curr(curr), end(end) {}
 
     inline bool Done() { return curr >= end; }
@@ -94,10 +664,11 @@ struct ByteStream {
         val = 0;
         // We relaxed the checks here. Sometimes we find that certain real-world datasets
         // doesn't fully match the schema; for example, an int32 was defined,
-        // but the actual data is int64.
+        // but the actual data is int64. Negative int32 values are also sign-extended to
+        // 10 bytes; only the low 32 bits are kept (shifting past them is undefined).
         for (int i = 0; i < 10; i++) {
             uint32_t b = buffer[curr++];
-            val |= (b & 0x7f) << (7 * i);
+            if (i < 5) val |= (b & 0x7f) << (7 * i);
             if (b < 0x80) {
                 return curr <= end;
             }
@@ -134,7 +705,7 @@ struct ByteStream {
     }
 
     inline bool ReadVarintLen(uint32_t& len) {
-        uint32_t curr_tmp = curr;
+        offset_t curr_tmp = curr;
         uint32_t shift = 0;
         for (len = 1; len <= 10; len++) {
             uint32_t b = buffer[curr_tmp++];
@@ -148,7 +719,7 @@ struct ByteStream {
 
     inline bool ReadTag(uint32_t& tag) {
 #ifdef COUNT_TAG_BYTES
-        uint32_t curr_tmp = curr;
+        offset_t curr_tmp = curr;
         bool res = readVarint32Strict(tag);
         stat_tag_bytes += curr - curr_tmp;
         return res;
@@ -161,6 +732,32 @@ struct ByteStream {
 
     inline bool ReadLen(uint32_t& len) { return readVarint32Strict(len) and IsLenValid(len); }
 
+    // skips the value of a field that is not decoded (see --projection)
+    inline bool SkipValue(uint32_t wire_type) {
+        uint32_t len;
+        switch (wire_type) {
+            case 0:
+                for (int i = 0; i < 10; i++) {
+                    if (buffer[curr++] < 0x80) return curr <= end;
+                }
+                return false;
+            case 1:
+                len = 8;
+                break;
+            case 2:
+                if (!readVarint32Strict(len)) return false;
+                break;
+            case 5:
+                len = 4;
+                break;
+            default:
+                return false;
+        }
+        if (!IsLenValid(len)) return false;
+        curr += len;
+        return true;
+    }
+
     template <typename T>
     inline bool ReadFixed(T& val) {
         int size = sizeof(T);
@@ -175,7 +772,8 @@ struct ByteStream {
         return true;
     }
 
-    inline bool ReadString(std::string& val, uint32_t len) {
+    template <typename S>
+    inline bool ReadString(S& val, uint32_t len) {
         if (curr + len > end or curr + len < curr) {
             return false;
         }
@@ -184,9 +782,13 @@ struct ByteStream {
         return true;
     }
 
-    inline bool ReadString(std::string& val) { return ReadString(val, end - curr); }
+    template <typename S>
+    inline bool ReadString(S& val) {
+        return ReadString(val, end - curr);
+    }
 
-    inline bool ReadStringAppend(std::string& val, uint32_t len) {
+    template <typename S>
+    inline bool ReadStringAppend(S& val, uint32_t len) {
         if (curr + len > end or curr + len < curr) {
             return false;
         }
@@ -195,55 +797,598 @@ struct ByteStream {
         return true;
     }
 
-    inline bool ReadStringAppend(std::string& val) { return ReadStringAppend(val, end - curr); }
+    template <typename S>
+    inline bool ReadStringAppend(S& val) {
+        return ReadStringAppend(val, end - curr);
+    }
 
     // Note: we don't overwrite current value
-    template <typename T>
-    inline bool ReadPackedVarint(std::vector<T>& nums, uint32_t len) {
-        uint32_t end_tmp = curr + len;
+    template <typename T, typename A>
+    inline bool ReadPackedVarint(std::vector<T, A>& nums, uint32_t len) {
+        offset_t end_tmp = curr + len;
         if (end_tmp > end or end_tmp < curr) {
             return false;
         }
 
-        T val;
-        while (curr < end_tmp) {
-            ReadVarint(val);
-            nums.push_back(val);
-        }
+        if constexpr (std::is_same<T, bool>::value) {
+            // std::vector<bool> has no contiguous storage
+            T val;
+            while (curr < end_tmp) {
+                ReadVarint(val);
+                nums.push_back(val);
+            }
+            return true;
+        } else {
+            // size the output exactly: one value per terminator byte, plus a trailing value
+            // that is cut by end_tmp (speculative parsing reads truncated ranges)
+            uint32_t cnt = simd::CountVarintTerminators(buffer + curr, len);
+            if (len > 0 and buffer[end_tmp - 1] >= 0x80) cnt++;
 
-        return true;
+            size_t old_size = nums.size();
+            nums.resize(old_size + cnt);
+            size_t decoded =
+                simd::DecodeVarints(buffer, curr, end_tmp, nums.data() + old_size, cnt);
+            nums.resize(old_size + decoded);
+
+            // malformed input, e.g., a run of more than 10 continuation bytes
+            T val;
+            while (curr < end_tmp) {
+                ReadVarint(val);
+                nums.push_back(val);
+            }
+            return true;
+        }
     }
 
-    template <typename T>
-    inline bool ReadPackedVarint(std::vector<T>& nums) {
+    template <typename T, typename A>
+    inline bool ReadPackedVarint(std::vector<T, A>& nums) {
         return ReadPackedVarint(nums, end - curr);
     }
 
     // Note: we don't overwrite current value
-    template <typename T>
-    inline bool ReadPackedFixed(std::vector<T>& nums, uint32_t len) {
-        uint32_t end_tmp = curr + len;
+    template <typename T, typename A>
+    inline bool ReadPackedFixed(std::vector<T, A>& nums, uint32_t len) {
+        offset_t end_tmp = curr + len;
         if (end_tmp > end or end_tmp < curr) {
             return false;
         }
 
-        T val;
-        while (curr < end_tmp) {
-            ReadFixed(val);
-            nums.push_back(val);
-        }
+        // a trailing value that is cut by end_tmp is still read as a whole
+        uint32_t cnt = (len + sizeof(T) - 1) / sizeof(T);
+        cnt = std::min<offset_t>(cnt, (end - curr) / sizeof(T));
+
+        size_t old_size = nums.size();
+        nums.resize(old_size + cnt);
+        memcpy(nums.data() + old_size, buffer + curr, cnt * sizeof(T));
+        curr += cnt * sizeof(T);
 
         return true;
     }
 
-    template <typename T>
-    inline bool ReadPackedFixed(std::vector<T>& nums) {
+    template <typename T, typename A>
+    inline bool ReadPackedFixed(std::vector<T, A>& nums) {
         return ReadPackedFixed(nums, end - curr);
     }
 };
 
-template <typename T>
-inline void move_copy(std::vector<T>& dst, std::vector<T>&& src) {
+// How a stream of length-delimited records is read: blocks of whole records, of at least
+// block_size bytes, with at most max_blocks blocks being read or decoded at a time.
+struct StreamOptions {
+    size_t block_size = 64 << 20;
+    size_t max_blocks = 4;
+};
+
+// A block of whole records copied from the stream. Records are [first, second) ranges
+// into data, which is followed by `padding` zero bytes like a Buffer.
+struct RecordBlock {
+    std::unique_ptr<uint8_t[]> data;
+    size_t capacity = 0;
+    size_t size = 0;
+    size_t first_record = 0;  // index of records[0] in the stream
+    std::vector<std::pair<offset_t, offset_t>> records;
+};
+
+// Reads length-delimited records (a varint length followed by the message, i.e., the
+// writeDelimitedTo framing) from a file, or from stdin if the path is "-". A reader thread
+// reads ahead while the caller decodes earlier blocks; Release() returns a block so its
+// memory is reused, which bounds the memory use to about max_blocks * block_size.
+class DelimitedReader {
+   public:
+    DelimitedReader(const std::string& path, const StreamOptions& options = StreamOptions())
+        : options(options) {
+        if (path == "-") {
+            fd = STDIN_FILENO;
+        } else {
+            fd = open(path.c_str(), O_RDONLY);
+            if (fd == -1) {
+                THROW_RUNTIME_ERROR("file open failed");
+            }
+        }
+        reader = std::thread([this] { ReadLoop(); });
+    }
+    DelimitedReader(const DelimitedReader&) = delete;
+    DelimitedReader& operator=(const DelimitedReader&) = delete;
+    ~DelimitedReader() {
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            stopped = true;
+        }
+        cond.notify_all();
+        reader.join();
+        if (fd != STDIN_FILENO) close(fd);
+    }
+
+    // the next block in stream order, or nullptr at the end of the stream
+    std::unique_ptr<RecordBlock> Next() {
+        std::unique_lock<std::mutex> lock(mutex);
+        cond.wait(lock, [this] { return !ready.empty() or done; });
+        if (ready.empty()) {
+            if (!error.empty()) {
+                THROW_RUNTIME_ERROR(error);
+            }
+            return nullptr;
+        }
+        auto block = std::move(ready.front());
+        ready.pop_front();
+        return block;
+    }
+
+    void Release(std::unique_ptr<RecordBlock> block) {
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            block->records.clear();
+            free_blocks.push_back(std::move(block));
+            in_flight--;
+        }
+        cond.notify_all();
+    }
+
+    size_t BytesRead() const { return bytes_read; }
+
+   private:
+    // reads until the buffer is full or the input ends
+    bool Fill(uint8_t* dst, size_t len, size_t& filled) {
+        filled = 0;
+        while (filled < len) {
+            ssize_t n = read(fd, dst + filled, len - filled);
+            if (n == 0) break;
+            if (n < 0) {
+                if (errno == EINTR) continue;
+                return false;
+            }
+            filled += n;
+        }
+        bytes_read += filled;
+        return true;
+    }
+
+    std::unique_ptr<RecordBlock> AcquireBlock(size_t capacity) {
+        std::unique_ptr<RecordBlock> block;
+        if (!free_blocks.empty()) {
+            block = std::move(free_blocks.back());
+            free_blocks.pop_back();
+        } else {
+            block = std::make_unique<RecordBlock>();
+        }
+        if (block->capacity < capacity) {
+            block->data.reset(new uint8_t[capacity + padding]);
+            block->capacity = capacity;
+        }
+        return block;
+    }
+
+    void Finish(const std::string& msg) {
+        std::lock_guard<std::mutex> lock(mutex);
+        error = msg;
+        done = true;
+        cond.notify_all();
+    }
+
+    void ReadLoop() {
+        std::vector<uint8_t> carry;  // a record cut by the end of the previous block
+        size_t next_record = 0;
+        size_t need = options.block_size;
+        bool eof = false;
+
+        while (!eof) {
+            std::unique_ptr<RecordBlock> block;
+            {
+                std::unique_lock<std::mutex> lock(mutex);
+                cond.wait(lock, [this] { return in_flight < options.max_blocks or stopped; });
+                if (stopped) return;
+                block = AcquireBlock(std::max(need, carry.size()));
+                in_flight++;
+            }
+
+            memcpy(block->data.get(), carry.data(), carry.size());
+            size_t filled;
+            if (!Fill(block->data.get() + carry.size(), block->capacity - carry.size(), filled)) {
+                Finish("read failed");
+                return;
+            }
+            filled += carry.size();
+            eof = filled < block->capacity;
+            memset(block->data.get() + filled, 0, padding);
+            block->size = filled;
+
+            // find the record boundaries; lengths are 32-bit like submessage lengths
+            size_t pos = 0;
+            need = options.block_size;
+            while (pos < filled) {
+                ByteStream bs(block->data.get(), pos, filled);
+                uint32_t len;
+                if (!bs.readVarint32Strict(len)) {
+                    if (filled - pos >= 5) {
+                        Finish("invalid record length");
+                        return;
+                    }
+                    break;
+                }
+                if (size_t(bs.curr) + len > filled) {
+                    need = std::max(need, bs.curr - pos + len);
+                    break;
+                }
+                block->records.emplace_back(bs.curr, bs.curr + len);
+                pos = bs.curr + len;
+            }
+            carry.assign(block->data.get() + pos, block->data.get() + filled);
+
+            if (eof and !carry.empty()) {
+                Finish("truncated record at the end of the stream");
+                return;
+            }
+
+            // the block is smaller than its first record, read again into a larger block
+            if (block->records.empty() and !eof) {
+                std::lock_guard<std::mutex> lock(mutex);
+                free_blocks.push_back(std::move(block));
+                in_flight--;
+                continue;
+            }
+
+            block->first_record = next_record;
+            next_record += block->records.size();
+            {
+                std::lock_guard<std::mutex> lock(mutex);
+                ready.push_back(std::move(block));
+            }
+            cond.notify_all();
+        }
+
+        Finish("");
+    }
+
+    StreamOptions options;
+    int fd;
+    std::atomic<size_t> bytes_read{0};
+
+    std::mutex mutex;
+    std::condition_variable cond;
+    std::deque<std::unique_ptr<RecordBlock>> ready;
+    std::vector<std::unique_ptr<RecordBlock>> free_blocks;
+    size_t in_flight = 0;
+    bool done = false, stopped = false;
+    std::string error;
+
+    std::thread reader;
+};
+
+// Calls f(buffer, begin, end, index) for every record of a length-delimited stream, and
+// block_done() after all records of a block, before the block memory is reused. The
+// records of a block are decoded in parallel while the reader reads ahead. Returns the
+// number of records.
+template <typename F, typename G>
+size_t ForEachDelimitedRecord(const std::string& path, const StreamOptions& options, F f,
+                              G block_done) {
+    DelimitedReader reader(path, options);
+    size_t cnt = 0;
+    while (auto block = reader.Next()) {
+        auto& records = block->records;
+        #pragma omp parallel for schedule(dynamic, 1)
+        for (size_t i = 0; i < records.size(); i++) {
+            f(block->data.get(), records[i].first, records[i].second, block->first_record + i);
+        }
+        block_done();
+        cnt += records.size();
+        reader.Release(std::move(block));
+    }
+    return cnt;
+}
+
+template <typename F>
+size_t ForEachDelimitedRecord(const std::string& path, const StreamOptions& options, F f) {
+    return ForEachDelimitedRecord(path, options, f, [] {});
+}
+
+// Counters of one SPP chunk. A chunk is speculated by one thread and merged by one thread
+// at a time, and every chunk has its own cache line, so the counters are plain fields.
+struct alignas(64) SppChunkMetrics {
+    offset_t begin = 0;  // the chunk is [begin, end)
+    offset_t end = 0;
+    offset_t start = 0;  // where speculation succeeded; end if it did not
+    int thread = -1;     // the thread that speculated the chunk
+    uint64_t visited_bytes = 0;
+    uint64_t fallbacks = 0;
+    uint64_t irs = 0;
+    uint64_t redo_bytes = 0;  // re-parsed by Merge
+    double speculate_time = 0;  // in seconds
+    double merge_time = 0;
+};
+
+// Run-time statistics of the last SPP Parse, collected when SppOptions::metrics points to
+// one. Unlike the COUNT_* builds, collecting them keeps the speculation parallel.
+struct SppMetrics {
+    double speculate_time = 0;  // in seconds, of the parallel phase
+    double merge_time = 0;      // after the parallel phase
+    double total_time = 0;
+    std::vector<SppChunkMetrics> chunks;
+
+    uint64_t VisitedBytes() const { return Sum(&SppChunkMetrics::visited_bytes); }
+    uint64_t Fallbacks() const { return Sum(&SppChunkMetrics::fallbacks); }
+    uint64_t IRs() const { return Sum(&SppChunkMetrics::irs); }
+    uint64_t RedoBytes() const { return Sum(&SppChunkMetrics::redo_bytes); }
+
+    void WriteJson(std::ostream& os) const {
+        os << "{\"speculate_time\": " << speculate_time << ", \"merge_time\": " << merge_time
+           << ", \"total_time\": " << total_time << ", \"visited_bytes\": " << VisitedBytes()
+           << ", \"fallbacks\": " << Fallbacks() << ", \"irs\": " << IRs()
+           << ", \"redo_bytes\": " << RedoBytes() << ", \"chunks\": [";
+        for (size_t i = 0; i < chunks.size(); i++) {
+            const auto& c = chunks[i];
+            os << (i ? ", " : "") << "{\"begin\": " << c.begin << ", \"end\": " << c.end
+               << ", \"start\": " << c.start << ", \"thread\": " << c.thread
+               << ", \"visited_bytes\": " << c.visited_bytes << ", \"fallbacks\": " << c.fallbacks
+               << ", \"irs\": " << c.irs << ", \"redo_bytes\": " << c.redo_bytes
+               << ", \"speculate_time\": " << c.speculate_time
+               << ", \"merge_time\": " << c.merge_time << "}";
+        }
+        os << "]}\n";
+    }
+
+   private:
+    uint64_t Sum(uint64_t SppChunkMetrics::*field) const {
+        uint64_t sum = 0;
+        for (const auto& c : chunks) sum += c.*field;
+        return sum;
+    }
+};
+
+// How SPP splits the input into chunks. By default there is one chunk per thread and
+// chunks are statically assigned; over-decomposing (chunks_per_thread > 1) with dynamic
+// scheduling keeps threads busy when speculation stalls on some chunks.
+struct SppOptions {
+    size_t chunks_per_thread = 1;
+    size_t min_chunk_size = 0;  // in bytes; 0 means no limit
+    bool dynamic_schedule = false;
+    double first_chunk_bonus = 0.15;  // the first chunk is parsed non-speculatively
+    // merge chunk i as soon as chunks 0..i are speculated, overlapped with the remaining
+    // speculation, instead of merging all chunks after the parallel phase
+    bool pipeline_merge = true;
+    bool print_timing = false;  // print the speculation/merge time of every Parse to stdout
+    // reorder the candidates of every thread by how often they succeeded in its earlier
+    // chunks and Parse calls
+    bool adaptive_candidates = false;
+    // try speculation only at the positions that pass a SIMD scan for the first byte of a
+    // tag and a check of the value behind it, instead of at every byte of the chunk head
+    bool filter_starts = true;
+    SppMetrics* metrics = nullptr;  // filled by every Parse if set
+
+    size_t NumChunks(size_t threads, size_t len) const {
+        size_t chunks = threads * std::max<size_t>(chunks_per_thread, 1);
+        if (min_chunk_size > 0) {
+            chunks = std::min(chunks, std::max<size_t>(len / min_chunk_size, 1));
+        }
+        return std::max<size_t>(chunks, 1);
+    }
+};
+
+// Splits [0, len) into the chunks of SPP: ls[i] and rs[i] bound chunk i, and the first chunk,
+// which is parsed non-speculatively, is more_work_percent larger than the others.
+inline void buildRangeArray(offset_t* ls, offset_t* rs, offset_t len, size_t tasks, double more_work_percent) {
+    // the first thread generally is faster than other threads so it should do more work
+    // e.g., the first thread should do 1.15X work compared to other threads
+    offset_t x = len * 1.0 / (tasks + more_work_percent);
+    ls[0] = 0;
+    rs[0] = (1.0 + more_work_percent) * x;
+    for (size_t i = 1; i < tasks; i++) {
+        ls[i] = rs[i - 1];
+        rs[i] = ls[i] + x;
+    }
+    rs[tasks - 1] = len;
+}
+
+// How a Buffer brings the input into memory (--io):
+// MMAP maps the file and leaves the page faults to the first touches of the decode;
+// POPULATE maps it with MAP_POPULATE, so the kernel reads and maps every page up front;
+// PREFAULT maps it and touches every page in parallel, thread i the range of SPP chunk i;
+// PREAD reads the file into anonymous memory, one pread per SPP chunk range in parallel.
+enum class IoMode { MMAP, POPULATE, PREFAULT, PREAD };
+
+inline IoMode ParseIoMode(const std::string& name) {
+    if (name == "populate") return IoMode::POPULATE;
+    if (name == "prefault") return IoMode::PREFAULT;
+    if (name == "pread") return IoMode::PREAD;
+    if (name == "mmap") return IoMode::MMAP;
+    THROW_RUNTIME_ERROR("unknown io mode " + name);
+}
+
+const size_t HUGE_PAGE_SIZE = 2 << 20;
+
+struct IoOptions {
+    IoMode mode = IoMode::MMAP;
+    bool sequential = false;  // madvise(MADV_SEQUENTIAL): aggressive read-ahead of a mapped file
+    // madvise(MADV_HUGEPAGE); a PREAD buffer is also aligned to HUGE_PAGE_SIZE. File mappings
+    // only get huge pages if the file system supports them
+    bool huge_pages = false;
+    SppOptions spp;  // PREFAULT and PREAD split the input into the chunks of SPP with these options
+};
+
+// the IoOptions of a Buffer built without them, e.g., set from --io
+inline IoOptions& DefaultIoOptions() {
+    static IoOptions options;
+    return options;
+}
+
+// The input file in memory, followed by `padding` zero bytes. The file and the padding sit in
+// one anonymous reservation: a file mapping of size + padding bytes would fault with SIGBUS
+// past the last page of the file, when size is a multiple of the page size.
+struct Buffer {
+    uint8_t* buffer;
+    size_t size;
+    size_t reserved;  // the bytes of the reservation at buffer
+
+    Buffer(const std::string& filename, const IoOptions& io = DefaultIoOptions()) {
+        int fd = open(filename.c_str(), O_RDONLY);
+
+        if (fd == -1) {
+            THROW_RUNTIME_ERROR("file open failed");
+        }
+
+        struct stat sb;
+        if (fstat(fd, &sb) == -1) {
+            close(fd);
+            THROW_RUNTIME_ERROR("fstate failed");
+        }
+        this->size = sb.st_size;
+        if (this->size + padding > std::numeric_limits<offset_t>::max()) {
+            close(fd);
+            THROW_RUNTIME_ERROR("input too large for 32-bit offsets, build with -DLARGE_INPUT");
+        }
+
+        size_t page = sysconf(_SC_PAGESIZE);
+        size_t align = io.huge_pages ? HUGE_PAGE_SIZE : page;
+        this->reserved = (this->size + padding + align - 1) / align * align;
+        int prot = io.mode == IoMode::PREAD ? PROT_READ | PROT_WRITE : PROT_READ;
+        this->buffer = Reserve(this->reserved, align, prot);
+        if (this->buffer == nullptr) {
+            close(fd);
+            THROW_RUNTIME_ERROR("mmap failed");
+        }
+        if (io.huge_pages) madvise(this->buffer, this->reserved, MADV_HUGEPAGE);
+
+        bool ok = io.mode == IoMode::PREAD ? Read(fd, io) : Map(fd, io, page);
+        close(fd);
+        if (!ok) {
+            munmap(this->buffer, this->reserved);
+            THROW_RUNTIME_ERROR(io.mode == IoMode::PREAD ? "pread failed" : "mmap failed");
+        }
+    }
+    Buffer(const Buffer&) = delete;
+    Buffer& operator=(const Buffer&) = delete;
+    ~Buffer() { assert(munmap(this->buffer, this->reserved) == 0); }
+
+    // Drops the clean pages of the file from the page cache, so that the next Buffer of it
+    // reads from the device; pages still mapped by a Buffer are kept.
+    static bool DropPageCache(const std::string& filename) {
+        int fd = open(filename.c_str(), O_RDONLY);
+        if (fd == -1) return false;
+        bool ok = posix_fadvise(fd, 0, 0, POSIX_FADV_DONTNEED) == 0;
+        close(fd);
+        return ok;
+    }
+
+   private:
+    // anonymous zero pages of the given size at a multiple of align
+    static uint8_t* Reserve(size_t size, size_t align, int prot) {
+        size_t page = sysconf(_SC_PAGESIZE);
+        size_t slack = align > page ? align : 0;
+        void* p = mmap(NULL, size + slack, prot, MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+        if (p == MAP_FAILED) return nullptr;
+        uintptr_t begin = reinterpret_cast<uintptr_t>(p);
+        uintptr_t aligned = (begin + align - 1) / align * align;
+        // unmap the slack on both sides of the aligned range
+        if (aligned > begin) munmap(p, aligned - begin);
+        if (begin + slack > aligned) munmap(reinterpret_cast<void*>(aligned + size), begin + slack - aligned);
+        return reinterpret_cast<uint8_t*>(aligned);
+    }
+
+    // the chunk ranges of SPP over the input
+    void Ranges(const IoOptions& io, std::vector<offset_t>& ls, std::vector<offset_t>& rs) const {
+        size_t tasks = io.spp.NumChunks(omp_get_max_threads(), this->size);
+        ls.resize(tasks);
+        rs.resize(tasks);
+        buildRangeArray(ls.data(), rs.data(), this->size, tasks, io.spp.first_chunk_bonus);
+    }
+
+    // maps the file over the start of the reservation; the rest stays zero
+    bool Map(int fd, const IoOptions& io, size_t page) {
+        if (this->size == 0) return true;
+        size_t length = (this->size + page - 1) / page * page;
+        int flags = MAP_PRIVATE | MAP_FIXED | (io.mode == IoMode::POPULATE ? MAP_POPULATE : 0);
+        if (mmap(this->buffer, length, PROT_READ, flags, fd, 0) == MAP_FAILED) return false;
+        if (io.sequential) madvise(this->buffer, length, MADV_SEQUENTIAL);
+        if (io.huge_pages) madvise(this->buffer, length, MADV_HUGEPAGE);
+
+        if (io.mode == IoMode::PREFAULT) {
+            std::vector<offset_t> ls, rs;
+            Ranges(io, ls, rs);
+            // static schedule, as SPP's default: thread i faults in the pages of the chunk it
+            // will speculate on
+            #pragma omp parallel for schedule(static, 1)
+            for (size_t i = 0; i < ls.size(); i++) {
+                for (size_t pos = ls[i] / page * page; pos < rs[i]; pos += page) {
+                    *reinterpret_cast<volatile uint8_t*>(this->buffer + pos);
+                }
+            }
+        }
+        return true;
+    }
+
+    // reads the file into the reservation, one chunk per thread
+    bool Read(int fd, const IoOptions& io) {
+        std::vector<offset_t> ls, rs;
+        Ranges(io, ls, rs);
+        std::atomic<bool> ok(true);
+        #pragma omp parallel for schedule(static, 1)
+        for (size_t i = 0; i < ls.size(); i++) {
+            size_t pos = ls[i];
+            while (pos < rs[i] and ok) {
+                ssize_t n = pread(fd, this->buffer + pos, rs[i] - pos, pos);
+                if (n < 0 and errno == EINTR) continue;
+                if (n <= 0) {
+                    ok = false;
+                    break;
+                }
+                pos += n;
+            }
+        }
+        return ok and mprotect(this->buffer, this->reserved, PROT_READ) == 0;
+    }
+};
+
+// One serialized message of a batch. Like a Buffer, the memory must stay readable for
+// `padding` bytes past the end since varints are read before the bound check.
+struct ByteSpan {
+    uint8_t* data;
+    offset_t size;
+
+    ByteSpan(uint8_t* data, offset_t size) : data(data), size(size) {}
+};
+
+// Batch decoding of many independent messages: items are spread over the threads and
+// decoded sequentially, except items of at least large_item_size bytes, which are decoded
+// one at a time by SPP with all threads.
+struct BatchOptions {
+    size_t large_item_size = 1 << 20;
+    SppOptions spp;
+};
+
+// Splits a buffer of length-delimited records into spans; returns false if the last record
+// is truncated.
+inline bool SplitDelimitedRecords(uint8_t* buffer, size_t size, std::vector<ByteSpan>& records) {
+    offset_t pos = 0;
+    while (pos < size) {
+        ByteStream bs(buffer, pos, size);
+        uint32_t len;
+        if (!bs.ReadLen(len)) return false;
+        records.emplace_back(buffer + bs.curr, len);
+        pos = bs.curr + len;
+    }
+    return true;
+}
+
+template <typename T, typename A>
+inline void move_copy(std::vector<T, A>& dst, std::vector<T, A>&& src) {
     if (dst.size() == 0) {
         dst = std::move(src);
     } else {
@@ -251,24 +1396,216 @@ inline void move_copy(std::vector<T>& dst, std::vector<T>&& src) {
     }
 }
 
-template <typename T>
-inline void move_copy(std::vector<T>& dst, T src) {
+template <typename T, typename A>
+inline void move_copy(std::vector<T, A>& dst, T src) {
     dst.push_back(std::move(src));
 }
 
+// ConvertToPB converts repeated message fields of at least this size as OpenMP tasks,
+// which run in parallel when ConvertToPB is called inside a parallel region
+const size_t PARALLEL_CONVERT_MIN_SIZE = 64;
+
+// TPP decodes the values of a field as an OpenMP task if they span at least
+// TPP_TASK_MIN_SIZE bytes, and splits a message value by its fields again (ParseInParallel)
+// if it spans at least TPP_SPLIT_MIN_SIZE bytes; smaller ones are parsed sequentially
+const size_t TPP_TASK_MIN_SIZE = 16 << 10;
+const size_t TPP_SPLIT_MIN_SIZE = 256 << 10;
+
+// The timings of the measured (non-warmup) runs of a benchmark, written as JSON with
+// --results_json. Confidence intervals and baselines are left to experiment/bench.py.
+struct BenchmarkResult {
+    std::string impl;
+    std::string file_path;
+    uint64_t bytes = 0;     // size of the input
+    uint64_t messages = 0;  // records of a batch or stream input, 0 otherwise
+    int threads = 0;
+    int warmup = 1;         // runs before the measured ones
+    std::vector<double> seconds;
+    std::vector<double> cold_seconds;  // runs after dropping the input from the page cache
+
+    static double Mean(const std::vector<double>& seconds) {
+        double sum = 0;
+        for (double s : seconds) sum += s;
+        return seconds.empty() ? 0 : sum / seconds.size();
+    }
+
+    double Mean() const { return Mean(seconds); }
+
+    double Stddev() const {
+        if (seconds.size() < 2) return 0;
+        double mean = Mean(), sq = 0;
+        for (double s : seconds) sq += (s - mean) * (s - mean);
+        return std::sqrt(sq / (seconds.size() - 1));
+    }
+
+    // nearest-rank percentile, p in [0, 100]
+    double Percentile(double p) const {
+        if (seconds.empty()) return 0;
+        std::vector<double> sorted(seconds);
+        std::sort(sorted.begin(), sorted.end());
+        size_t rank = static_cast<size_t>(std::ceil(p / 100 * sorted.size()));
+        return sorted[std::max<size_t>(rank, 1) - 1];
+    }
+
+    void WriteJson(std::ostream& os) const {
+        double mean = Mean();
+        os << "{\"impl\": \"" << impl << "\", \"file_path\": \"" << file_path
+           << "\", \"bytes\": " << bytes << ", \"messages\": " << messages
+           << ", \"threads\": " << threads << ", \"warmup\": " << warmup << ", \"seconds\": [";
+        for (size_t i = 0; i < seconds.size(); i++) os << (i ? ", " : "") << seconds[i];
+        os << "], \"mean\": " << mean << ", \"stddev\": " << Stddev()
+           << ", \"min\": " << Percentile(0) << ", \"p50\": " << Percentile(50)
+           << ", \"p90\": " << Percentile(90) << ", \"p99\": " << Percentile(99)
+           << ", \"max\": " << Percentile(100)
+           << ", \"bytes_per_second\": " << (mean > 0 ? bytes / mean : 0) << ", \"cold_seconds\": [";
+        for (size_t i = 0; i < cold_seconds.size(); i++) os << (i ? ", " : "") << cold_seconds[i];
+        os << "], \"cold_mean\": " << Mean(cold_seconds) << "}\n";
+    }
+};
+
+// Features of a schema that the decoder cost model depends on, computed by the generator
+// (gen_const.schema_features) and emitted as SPP::Features.
+struct SchemaFeatures {
+    double ambiguity;     // mean number of CandidatesInit per tag
+    double depth;         // nesting depth of the message tree, recursion counted as MAX_FEATURE_DEPTH
+    double string_share;  // share of the input in string/bytes values (a prior from the schema)
+};
+
+// The share of printable ASCII bytes in up to TEXT_SAMPLE_WINDOWS evenly spaced windows of
+// TEXT_SAMPLE_WINDOW bytes, an estimate of the string share of an input (experiment/calibrate.py
+// samples the same way).
+const size_t TEXT_SAMPLE_WINDOWS = 16;
+const size_t TEXT_SAMPLE_WINDOW = 4096;
+
+inline double SampleTextShare(const uint8_t* p, size_t size) {
+    if (size == 0) return 0;
+    size_t windows = std::min(TEXT_SAMPLE_WINDOWS, (size + TEXT_SAMPLE_WINDOW - 1) / TEXT_SAMPLE_WINDOW);
+    size_t sampled = 0, text = 0;
+    for (size_t w = 0; w < windows; w++) {
+        size_t begin = windows == 1 ? 0 : (size - std::min(size, TEXT_SAMPLE_WINDOW)) * w / (windows - 1);
+        size_t end = std::min(size, begin + TEXT_SAMPLE_WINDOW);
+        for (size_t i = begin; i < end; i++) text += p[i] >= 0x20 and p[i] < 0x7f;
+        sampled += end - begin;
+    }
+    return double(text) / sampled;
+}
+
+struct ImplChoice {
+    std::string impl;  // bl, tpp or spp
+    int threads;
+    double seconds;    // the predicted decode time
+};
+
+// Predicts the decode time of each implementation with t threads on n bytes as
+//     fixed + per_thread * t + n * (serial + parallel / t)
+// where serial and parallel are linear in x = (1, ambiguity, depth, string share). The defaults
+// are rough; `make calibrate` fits the coefficients on the local machine and --cost_model loads them.
+struct CostModel {
+    static constexpr int NUM_FEATURES = 4;
+
+    struct Coefficients {
+        double fixed;
+        double per_thread;
+        double serial[NUM_FEATURES];
+        double parallel[NUM_FEATURES];
+    };
+
+    Coefficients bl = {1e-6, 0, {12e-9, 0, 0, -4e-9}, {0, 0, 0, 0}};
+    Coefficients tpp = {5e-6, 5e-6, {1.5e-9, 0, 0.3e-9, 0}, {11e-9, 0, 0, -4e-9}};
+    Coefficients spp = {2e-5, 1e-5, {0.5e-9, 0.2e-9, 0, 0}, {12e-9, 1e-9, 0, -4e-9}};
+
+    // reads the file written by experiment/calibrate.py: one line per implementation,
+    // "<impl> <fixed> <per_thread> <serial x4> <parallel x4>"
+    bool Load(const std::string& path) {
+        std::ifstream in(path);
+        std::string impl;
+        while (in >> impl) {
+            Coefficients c;
+            in >> c.fixed >> c.per_thread;
+            for (double& v : c.serial) in >> v;
+            for (double& v : c.parallel) in >> v;
+            if (!in) return false;
+            if (impl == "bl") bl = c;
+            else if (impl == "tpp") tpp = c;
+            else if (impl == "spp") spp = c;
+            else return false;
+        }
+        return in.eof();
+    }
+
+    static double Predict(const Coefficients& c, const double* x, double bytes, int threads) {
+        double serial = 0, parallel = 0;
+        for (int i = 0; i < NUM_FEATURES; i++) {
+            serial += c.serial[i] * x[i];
+            parallel += c.parallel[i] * x[i];
+        }
+        // a fit can turn a per-byte cost negative outside the calibrated range
+        serial = std::max(serial, 0.0);
+        parallel = std::max(parallel, 0.0);
+        return c.fixed + c.per_thread * threads + bytes * (serial + parallel / threads);
+    }
+
+    // the fastest implementation and thread count (powers of two up to max_threads, and
+    // max_threads) for an input of size bytes; text_share >= 0 replaces the schema's string share
+    ImplChoice Choose(const SchemaFeatures& schema, size_t size, int max_threads, double text_share = -1) const {
+        double x[NUM_FEATURES] = {1, schema.ambiguity, schema.depth,
+                                  text_share >= 0 ? text_share : schema.string_share};
+        ImplChoice best = {"bl", 1, Predict(bl, x, size, 1)};
+        for (int t = 1;; t = std::min(t * 2, max_threads)) {
+            double seconds = Predict(tpp, x, size, t);
+            if (seconds < best.seconds) best = {"tpp", t, seconds};
+            seconds = Predict(spp, x, size, t);
+            if (seconds < best.seconds) best = {"spp", t, seconds};
+            if (t >= max_threads) break;
+        }
+        return best;
+    }
+};
+
 struct Args {
     std::string file_path;
     std::string test_mode;
     std::string impl;
     int runs;
+    std::string simd;
+    SppOptions spp;
+    bool delimited;  // the input is a stream of length-delimited records
+    bool batch;      // the input is length-delimited records decoded as one batch
+    StreamOptions stream;
+    BatchOptions batch_options;
+    bool columnar;  // also convert the decoded message into columns
+    bool to_pb;     // also convert the decoded message into PB:: messages on an Arena
+    std::string metrics_json;  // where to write the SppMetrics of the last SPP Parse
+    int warmup;                // benchmark runs that are not measured
+    std::string results_json;  // where to write the BenchmarkResult
+    std::string cost_model;    // coefficients of the CostModel used by impl=auto
+    bool auto_sample;          // impl=auto: estimate the string share from a sample of the input
+    bool reuse_context;        // SPP runs decode one mapped input with one DecoderContext
+    IoOptions io;              // how every Buffer reads the input
+    int cold_runs;             // benchmark runs after dropping the input from the page cache
 
     Args()
         : test_mode("C"),
           impl("BL"),
-          runs(5) {}
+          runs(5),
+          simd("auto"),
+          delimited(false),
+          batch(false),
+          columnar(false),
+          to_pb(false),
+          warmup(1),
+          auto_sample(true),
+          reuse_context(false),
+          cold_runs(0) {}
 
     void print() {
-        std::cout << file_path << "|" << test_mode << "|" << impl << "|" << runs << "\n";
+        std::cout << file_path << "|" << test_mode << "|" << impl << "|" << runs << "|" << simd
+                  << "|" << spp.chunks_per_thread << "|" << spp.min_chunk_size << "|"
+                  << (spp.dynamic_schedule ? "dynamic" : "static") << "|" << spp.pipeline_merge
+                  << "|" << delimited << "|" << stream.block_size << "|" << stream.max_blocks
+                  << "|" << batch << "|" << batch_options.large_item_size << "|" << columnar
+                  << "|" << to_pb << "|" << spp.adaptive_candidates << "|" << spp.filter_starts
+                  << "\n";
     }
 };
 
@@ -280,6 +1617,29 @@ inline Args ReadArgs(int argc, char* argv[]) {
         {"test_mode", required_argument, 0, 0},
         {"impl", required_argument, 0, 0},
         {"runs", required_argument, 0, 0},
+        {"simd", required_argument, 0, 0},
+        {"chunks_per_thread", required_argument, 0, 0},
+        {"min_chunk_size", required_argument, 0, 0},
+        {"schedule", required_argument, 0, 0},
+        {"pipeline_merge", required_argument, 0, 0},
+        {"input_format", required_argument, 0, 0},
+        {"block_size", required_argument, 0, 0},
+        {"max_blocks", required_argument, 0, 0},
+        {"large_item_size", required_argument, 0, 0},
+        {"columnar", required_argument, 0, 0},
+        {"to_pb", required_argument, 0, 0},
+        {"adaptive_candidates", required_argument, 0, 0},
+        {"filter_starts", required_argument, 0, 0},
+        {"metrics_json", required_argument, 0, 0},
+        {"warmup", required_argument, 0, 0},
+        {"results_json", required_argument, 0, 0},
+        {"cost_model", required_argument, 0, 0},
+        {"auto_sample", required_argument, 0, 0},
+        {"reuse_context", required_argument, 0, 0},
+        {"io", required_argument, 0, 0},
+        {"io_sequential", required_argument, 0, 0},
+        {"io_huge_pages", required_argument, 0, 0},
+        {"cold_runs", required_argument, 0, 0},
         {0, 0, 0, 0}  // End of options
     };
 
@@ -299,6 +1659,53 @@ inline Args ReadArgs(int argc, char* argv[]) {
                 result.impl = optarg;
             } else if (opt_name == "runs") {
                 result.runs = std::stoi(optarg);
+            } else if (opt_name == "simd") {
+                result.simd = optarg;
+            } else if (opt_name == "chunks_per_thread") {
+                result.spp.chunks_per_thread = std::stoul(optarg);
+            } else if (opt_name == "min_chunk_size") {
+                result.spp.min_chunk_size = std::stoul(optarg);
+            } else if (opt_name == "schedule") {
+                result.spp.dynamic_schedule = std::string(optarg) == "dynamic";
+            } else if (opt_name == "pipeline_merge") {
+                result.spp.pipeline_merge = std::stoi(optarg) != 0;
+            } else if (opt_name == "input_format") {
+                result.delimited = std::string(optarg) == "delimited";
+                result.batch = std::string(optarg) == "batch";
+            } else if (opt_name == "block_size") {
+                result.stream.block_size = std::stoul(optarg);
+            } else if (opt_name == "max_blocks") {
+                result.stream.max_blocks = std::max<size_t>(std::stoul(optarg), 1);
+            } else if (opt_name == "large_item_size") {
+                result.batch_options.large_item_size = std::stoul(optarg);
+            } else if (opt_name == "columnar") {
+                result.columnar = std::stoi(optarg) != 0;
+            } else if (opt_name == "to_pb") {
+                result.to_pb = std::stoi(optarg) != 0;
+            } else if (opt_name == "adaptive_candidates") {
+                result.spp.adaptive_candidates = std::stoi(optarg) != 0;
+            } else if (opt_name == "filter_starts") {
+                result.spp.filter_starts = std::stoi(optarg) != 0;
+            } else if (opt_name == "metrics_json") {
+                result.metrics_json = optarg;
+            } else if (opt_name == "warmup") {
+                result.warmup = std::max(std::stoi(optarg), 0);
+            } else if (opt_name == "results_json") {
+                result.results_json = optarg;
+            } else if (opt_name == "cost_model") {
+                result.cost_model = optarg;
+            } else if (opt_name == "auto_sample") {
+                result.auto_sample = std::stoi(optarg) != 0;
+            } else if (opt_name == "reuse_context") {
+                result.reuse_context = std::stoi(optarg) != 0;
+            } else if (opt_name == "io") {
+                result.io.mode = ParseIoMode(optarg);
+            } else if (opt_name == "io_sequential") {
+                result.io.sequential = std::stoi(optarg) != 0;
+            } else if (opt_name == "io_huge_pages") {
+                result.io.huge_pages = std::stoi(optarg) != 0;
+            } else if (opt_name == "cold_runs") {
+                result.cold_runs = std::max(std::stoi(optarg), 0);
             }
         } else {
             break;
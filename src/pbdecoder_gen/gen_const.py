@@ -1,6 +1,26 @@
 from .gen_from_proto import Field, prototype_to_cpptype, prototype_to_wiretype
+from dataclasses import dataclass
 from pprint import pprint
 
+# tag spaces up to this size are indexed directly, larger (sparse) ones through a perfect hash
+DENSE_TAG_LIMIT = 1 << 12
+
+# the single-level perfect hash takes the smallest collision-free modulus up to this many times
+# the number of tags; beyond, the tags go into a displacement hash (construct_displaced_hash)
+MAX_HASH_LOAD = 4
+# as in DisplacedHash of lib.h
+HASH_MULTIPLIER = 0x9E3779B1
+
+# a profiling sample is cut after this many bytes
+PROFILE_MAX_BYTES = 16 << 20
+
+# the nesting depth of a recursive schema in SchemaFeatures
+MAX_FEATURE_DEPTH = 16
+
+# a (PType, tag) state keeps at most this many message candidates, the nearest in the parent
+# graph; see construct_candidates
+MAX_MESSAGE_CANDIDATES = 32
+
 def valid_tags(fields: list[Field]):
     ret = set()
     for field in fields:
@@ -9,6 +29,10 @@ def valid_tags(fields: list[Field]):
             ret.add(field.field_id << 3 | prototype_to_wiretype[field.proto_type])
     return list(ret)
 
+def construct_tpp_field_index(fields: list[Field]) -> "TagIndex":
+    """TPP: tag, packed or not, -> position of the field in fields"""
+    return construct_tag_index({tag: i for i, field in enumerate(fields) for tag in valid_tags([field])})
+
 def construct_ptypes(messages: dict[str, list[Field]]) -> list[tuple[str, int]]:
     ptypes: list[tuple[str, int]] = []
 
@@ -21,8 +45,7 @@ def construct_ptypes(messages: dict[str, list[Field]]) -> list[tuple[str, int]]:
 
     for message_name, fields in messages.items():
         for field in fields:
-            if field.ptype not in visited and \
-               field.proto_type in prototype_to_cpptype.keys():
+            if field.ptype not in visited and field.ptype not in messages:
                 visited.add(field.ptype)
                 ptypes.append((field.ptype, index))
                 index += 1
@@ -35,7 +58,7 @@ def construct_primary_ptype_mapping(messages: dict[str, list[Field]]) -> dict[st
 
     for _, fields in messages.items():
         for field in fields:
-            if field.proto_type in prototype_to_cpptype.keys():
+            if field.proto_type in prototype_to_cpptype.keys() and not field.skip:
                 primary_ptype_mapping[field.ptype] = field.cpp_type_single if field.proto_type in wiretype2 else field.cpp_type
     
     return primary_ptype_mapping
@@ -60,7 +83,57 @@ def construct_candidates_init(messages: dict[str, list[Field]], disable_type_pri
     return {k: sorted(sorted(v), key=lambda x: 0 if x in embedded_messages else 1) 
             for k, v in candidates_init.items() }
 
-def construct_candidates(messages: dict[str, list[Field]], disable_type_prioritization: bool) -> dict[str, dict[int, list[str]]]:
+def strongly_connected_components(graph: dict[str, list[str]]) -> list[list[str]]:
+    """
+    Tarjan's algorithm, iterative so that deep schemas don't hit the recursion limit.
+    A component is returned after every component reachable from it.
+    """
+    index: dict[str, int] = {}
+    low: dict[str, int] = {}
+    stack: list[str] = []
+    on_stack = set()
+    components: list[list[str]] = []
+
+    for source in graph:
+        if source in index:
+            continue
+        index[source] = low[source] = len(index)
+        stack.append(source)
+        on_stack.add(source)
+        work = [(source, iter(graph[source]))]
+        while work:
+            u, edges = work[-1]
+            for v in edges:
+                if v not in index:
+                    index[v] = low[v] = len(index)
+                    stack.append(v)
+                    on_stack.add(v)
+                    work.append((v, iter(graph[v])))
+                    break
+                if v in on_stack:
+                    low[u] = min(low[u], index[v])
+            else:
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[u])
+                if low[u] == index[u]:
+                    component = []
+                    while True:
+                        v = stack.pop()
+                        on_stack.discard(v)
+                        component.append(v)
+                        if v == u:
+                            break
+                    components.append(component)
+    return components
+
+def construct_candidates(messages: dict[str, list[Field]],
+                         disable_type_prioritization: bool) -> tuple[dict[str, dict[int, list[str]]], dict[str, set[int]]]:
+    """
+    The candidates of every (PType, tag) state, and the tags after which a message PType
+    prefers itself (self_first). Starts in one strongly connected component share their
+    lists; "same type first" is applied at run time, so no start needs its own copy.
+    """
     root = list(messages.keys())[0]
 
     parent: dict[str, set[str]] = {}
@@ -70,40 +143,110 @@ def construct_candidates(messages: dict[str, list[Field]], disable_type_prioriti
                 parent[field.ptype] = set()
             parent[field.ptype].add(message_name)
 
-    candidates: dict[str, dict[int, set[str]]] = {}
+    # The candidates after a value of some PType are the fields of every message reachable
+    # from it in the parent graph, without walking past the root. Nodes of a strongly
+    # connected component reach the same messages, so the candidates are computed once per
+    # component, from the components it reaches (which come first). A set of PTypes is a
+    # bitmask over the PTypes in name order.
+    graph = {node: [] for node in list(messages.keys()) + list(parent.keys())}
+    for node in graph:
+        if node != root:
+            graph[node] = sorted(parent.get(node, ()))
 
-    visited = set()
-    def dfs(start: str, u: str):
-        if u == root:
-            return
-        if u in visited:
-            return
-        visited.add(u)
-        for p in parent[u]:
-            for field in messages[p]:
-                if field.tag not in candidates[start]:
-                    candidates[start][field.tag] = set()
-                candidates[start][field.tag].add(field.ptype)
-            dfs(start, p)
+    names = sorted(parent.keys())
+    bit = {name: i for i, name in enumerate(names)}
 
+    own: dict[str, dict[int, int]] = {}
     for message_name, fields in messages.items():
+        own[message_name] = {}
         for field in fields:
-            candidates[field.ptype] = dict()
-            visited.clear()
-            dfs(field.ptype, field.ptype)
-    
+            own[message_name][field.tag] = own[message_name].get(field.tag, 0) | (1 << bit[field.ptype])
+
+    def merge(dst: dict[int, int], src: dict[int, int]):
+        for tag, mask in src.items():
+            dst[tag] = dst.get(tag, 0) | mask
+
+    # Below a large cycle, the closure of every component holds most of the schema, and
+    # storing it for each state makes the tables quadratic in the number of messages. A state
+    # keeps the MAX_MESSAGE_CANDIDATES messages nearest to it instead (near: message ->
+    # distance in the parent graph). A speculation the list misses tries the next start, and
+    # Merge checks the type of every field either way.
+    own_messages: dict[str, dict[int, list[str]]] = {}
+    for message_name, fields in messages.items():
+        own_messages[message_name] = {}
+        for field in fields:
+            if field.ptype in messages:
+                own_messages[message_name].setdefault(field.tag, []).append(field.ptype)
+    message_mask = sum(1 << bit[name] for name in messages if name in bit)
+
+    component_of: dict[str, int] = {}
+    reached: list[dict[int, int]] = []
+    near: list[dict[int, dict[str, int]]] = []
+    for i, component in enumerate(strongly_connected_components(graph)):
+        for node in component:
+            component_of[node] = i
+        tag_ptypes: dict[int, int] = {}
+        tag_near: dict[int, dict[str, int]] = {}
+        for node in component:
+            for p in graph[node]:
+                merge(tag_ptypes, own[p])
+                for tag, ptypes in own_messages[p].items():
+                    tag_near.setdefault(tag, {}).update((ptype, 1) for ptype in ptypes)
+                if component_of[p] != i:
+                    merge(tag_ptypes, reached[component_of[p]])
+                    for tag, distances in near[component_of[p]].items():
+                        dst = tag_near.setdefault(tag, {})
+                        for ptype, d in distances.items():
+                            if dst.get(ptype, d + 2) > d + 1:
+                                dst[ptype] = d + 1
+        reached.append(tag_ptypes)
+        near.append({tag: dict(sorted(distances.items(), key=lambda x: (x[1], x[0]))[:MAX_MESSAGE_CANDIDATES])
+                     for tag, distances in tag_near.items()})
+
+    def kept(i: int, tag: int) -> int:
+        mask = reached[i][tag]
+        if bin(mask & message_mask).count("1") <= MAX_MESSAGE_CANDIDATES:
+            return mask
+        return (mask & ~message_mask) | sum(1 << bit[ptype] for ptype in near[i][tag])
+
     embedded_messages = set(messages.keys())
 
     if disable_type_prioritization:
         print("type prioritization is disabled")
-        # simulate a bad order here
-        return {start: {tag: sorted(list(ptypes), reverse=True) for tag, ptypes in tag_ptypes.items()} 
-                for start, tag_ptypes in candidates.items()}
 
-    # enable type prioritization
-    return {start: {tag: sorted(sorted(ptypes), key=lambda ptype: ((0, ptype) if start == ptype else (1, ptype)) if ptype in embedded_messages else (2, ptype))
-                for tag, ptypes in tag_ptypes.items()} 
-            for start, tag_ptypes in candidates.items()}
+    decoded: dict[int, list[str]] = {}
+
+    def ordered(mask: int) -> list[str]:
+        if mask in decoded:
+            return decoded[mask]
+        bits = bin(mask)[:1:-1]
+        ptypes = []
+        i = bits.find("1")
+        while i >= 0:
+            ptypes.append(names[i])
+            i = bits.find("1", i + 1)
+        if disable_type_prioritization:
+            # simulate a bad order here
+            decoded[mask] = ptypes[::-1]
+        else:
+            # enable type prioritization: messages first
+            decoded[mask] = [p for p in ptypes if p in embedded_messages] + [p for p in ptypes if p not in embedded_messages]
+        return decoded[mask]
+
+    lists: dict[int, dict[int, list[str]]] = {}
+    candidates: dict[str, dict[int, list[str]]] = {}
+    self_first: dict[str, set[int]] = {}
+    for start in parent:
+        i = component_of[start]
+        if i not in lists:
+            lists[i] = {tag: ordered(kept(i, tag)) for tag in reached[i]}
+        candidates[start] = lists[i]
+        if disable_type_prioritization or start not in embedded_messages:
+            continue
+        # prefer the same type
+        self_first[start] = {tag for tag, mask in reached[i].items() if mask >> bit[start] & 1}
+
+    return candidates, self_first
 
     # only use tag to speculate; prefer the same type
     # candidates_init = construct_candidates_init(messages)
@@ -113,6 +256,125 @@ def construct_candidates(messages: dict[str, list[Field]], disable_type_prioriti
     #             for tag, ptypes in tag_ptypes.items()} 
     #         for start, tag_ptypes in candidates.items()}
 
+@dataclass
+class TransitionProfile:
+    """how often each speculation state transition occurs in a sample of inputs"""
+    init: dict[int, dict[str, int]]                     # tag -> PType -> count
+    transitions: dict[str, dict[int, dict[str, int]]]   # PType -> next tag -> next PType -> count
+    samples: int = 0
+    bytes: int = 0
+
+def read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    value, shift = 0, 0
+    while True:
+        if pos >= len(data) or shift > 63:
+            raise ValueError("truncated or malformed varint")
+        b = data[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+def profile_transitions(messages: dict[str, list[Field]], paths: list[str]) -> TransitionProfile:
+    """
+    Walks serialized main messages the way BL does and counts the (PType, tag) -> PType
+    transitions SPP speculates on. A chunk may start at any depth, so a tag that follows the
+    end of a message counts as a transition from every value that ends there: the last
+    value inside the message, and the message itself.
+    """
+    root = list(messages.keys())[0]
+    by_tag = {message_name: {field.tag: field for field in fields} for message_name, fields in messages.items()}
+    profile = TransitionProfile(init={}, transitions={})
+
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read(PROFILE_MAX_BYTES)
+        profile.samples += 1
+        profile.bytes += len(data)
+
+        pos = 0
+        ended: list[str] = []   # PTypes of the values ending at pos
+        stack = [(root, len(data), None)]
+        try:
+            while stack:
+                message_name, end, ptype = stack[-1]
+                if pos >= end:
+                    stack.pop()
+                    if ptype is not None:
+                        ended.append(ptype)
+                    continue
+
+                tag, pos = read_varint(data, pos)
+                field = by_tag[message_name].get(tag)
+                if field is None:
+                    raise ValueError(f"unexpected tag {tag} in {message_name}")
+
+                counts = profile.init.setdefault(tag, {})
+                counts[field.ptype] = counts.get(field.ptype, 0) + 1
+                for prev in ended:
+                    counts = profile.transitions.setdefault(prev, {}).setdefault(tag, {})
+                    counts[field.ptype] = counts.get(field.ptype, 0) + 1
+                ended = []
+
+                wire_type = tag & 7
+                if wire_type == 0:
+                    _, pos = read_varint(data, pos)
+                elif wire_type == 1:
+                    pos += 8
+                elif wire_type == 5:
+                    pos += 4
+                else:
+                    length, pos = read_varint(data, pos)
+                    if field.is_embedded_message and not field.skip:
+                        stack.append((field.proto_type, pos + length, field.ptype))
+                        continue
+                    pos += length
+                ended = [field.ptype]
+        except ValueError as e:
+            # a truncated sample still profiles everything before the cut
+            if len(data) < PROFILE_MAX_BYTES:
+                print(f"profile {path}: stopped at byte {pos}: {e}")
+
+    return profile
+
+def order_by_profile(ptypes: list[str], counts: dict[str, int], first: set[str]) -> list[str]:
+    """
+    The candidates of a state observed in the profile, most frequent first. PTypes in
+    `first` (the messages, with type prioritization) still go before the others: a
+    scalar almost always parses, so a frequent scalar ahead of a message would be accepted
+    where the message was right and only be caught, and redone, in Merge. Candidates never
+    seen in an observed state are pruned; unobserved states keep the static order.
+    """
+    seen = [ptype for ptype in ptypes if counts.get(ptype, 0) > 0]
+    if not seen:
+        return ptypes
+    return sorted(seen, key=lambda ptype: (ptype not in first, -counts[ptype]))
+
+def apply_profile(candidates_init: dict[int, list[str]],
+                  candidates: dict[str, dict[int, list[str]]],
+                  self_first: dict[str, set[int]],
+                  profile: TransitionProfile,
+                  first: set[str]) -> tuple[dict[int, list[str]], dict[str, dict[int, list[str]]], dict[str, set[int]]]:
+    """an observed state gets its own list, with the same type first as a tie-breaker"""
+    candidates_init = {tag: order_by_profile(ptypes, profile.init.get(tag, {}), first)
+                       for tag, ptypes in candidates_init.items()}
+    ordered: dict[str, dict[int, list[str]]] = {}
+    unobserved: dict[str, set[int]] = {}
+    for start, tag_ptypes in candidates.items():
+        ordered[start] = {}
+        unobserved[start] = set(self_first.get(start, ()))
+        for tag, ptypes in tag_ptypes.items():
+            counts = profile.transitions.get(start, {}).get(tag, {})
+            if not any(counts.get(ptype, 0) > 0 for ptype in ptypes):
+                ordered[start][tag] = ptypes
+                continue
+            if tag in unobserved[start]:
+                unobserved[start].discard(tag)
+                ptypes = [start] + [p for p in ptypes if p != start]
+            ordered[start][tag] = order_by_profile(ptypes, counts, first)
+    return candidates_init, ordered, unobserved
+
 def construct_merge_type_check(messages: dict[str, list[Field]]) -> dict[str, dict[int, str]]:
     res: dict[str, dict[int, str]] = {}
 
@@ -122,3 +384,216 @@ def construct_merge_type_check(messages: dict[str, list[Field]]) -> dict[str, di
             res[message_name][field.tag] = field.ptype
     
     return res
+
+@dataclass
+class TagIndex:
+    """tag -> index, directly or, if the tags are too large, through a perfect hash"""
+    slots: list[int]             # dense mode: tag -> index (-1 if invalid)
+    hash_mod: int                # hash mode (> 0): index of tag is hash_slots[tag % hash_mod]
+    hash_keys: list[int]
+    hash_slots: list[int]
+    # if not empty, a displacement hash: hash_slots[displaced_hash(tag, hash_displace, hash_bits)]
+    hash_displace: list[int]
+    hash_bits: int
+
+    @property
+    def is_dense(self) -> bool:
+        return self.hash_mod == 0
+
+@dataclass
+class DispatchTables:
+    """
+    Flat tables replacing the CandidatesInit/Candidates/MergeTypeCheck maps in SPP.
+    A tag is first mapped to a slot (directly or through a perfect hash), then every
+    table is indexed by (PType, slot). A candidate list is a [begin, end) range in pool.
+    """
+    tags: list[int]
+    tag_slots: list[int]         # dense mode: tag -> slot (-1 if invalid)
+    hash_mod: int                # hash mode (> 0): slot of tag is hash_slots[tag % hash_mod]
+    hash_keys: list[int]
+    hash_slots: list[int]
+    hash_displace: list[int]     # as in TagIndex
+    hash_bits: int
+    pool: list[str]
+    candidates_init: list[tuple[int, int]]        # [slot]
+    candidates: list[list[tuple[int, int]]]       # [ptype][slot]
+    self_first: list[list[bool]]                  # [ptype][slot]: the PType itself goes before its range
+    lists: list[tuple[int, int]]                  # the ranges of more than one candidate
+    merge_type_check: list[list[str]]             # [message ptype][slot], "" if invalid
+    start_bytes: tuple[list[int], list[int]]      # ByteSet rows of the first byte of a chunk's first tag
+
+    @property
+    def is_dense(self) -> bool:
+        return self.hash_mod == 0
+
+def construct_perfect_hash(tags: list[int]) -> int:
+    """the smallest modulus up to MAX_HASH_LOAD * len(tags) for which tag % modulus is collision-free, or 0"""
+    for mod in range(max(len(tags), 1), MAX_HASH_LOAD * max(len(tags), 1) + 1):
+        if len({tag % mod for tag in tags}) == len(tags):
+            return mod
+    return 0
+
+def displaced_hash(tag: int, displace: list[int], bits: int) -> int:
+    return (((tag ^ displace[tag % len(displace)]) * HASH_MULTIPLIER) & 0xFFFFFFFF) >> (32 - bits)
+
+def construct_displaced_hash(tags: list[int], max_tries: int = 1 << 16) -> tuple[list[int], int]:
+    """
+    A two-level perfect hash for tags no small modulus separates: tags are split into buckets
+    by tag % len(displace), and every bucket gets the displacement that puts its tags into
+    free slots of a table of 2 ** bits slots. The largest buckets are placed first.
+    """
+    bits = max(2 * len(tags) - 1, 1).bit_length()
+    while True:
+        num_buckets = max(len(tags) // 4, 1)
+        buckets: list[list[int]] = [[] for _ in range(num_buckets)]
+        for tag in tags:
+            buckets[tag % num_buckets].append(tag)
+        displace = [0] * num_buckets
+        used: set[int] = set()
+        for b in sorted(range(num_buckets), key=lambda b: -len(buckets[b])):
+            for d in range(max_tries):
+                displace[b] = d
+                slots = {displaced_hash(tag, displace, bits) for tag in buckets[b]}
+                if len(slots) == len(buckets[b]) and not slots & used:
+                    used |= slots
+                    break
+            else:
+                break
+        else:
+            return displace, bits
+        bits += 1
+
+def construct_tag_index(index_of: dict[int, int]) -> TagIndex:
+    tags = sorted(index_of.keys())
+    if not tags or tags[-1] < DENSE_TAG_LIMIT:
+        slots = [-1] * ((tags[-1] + 1) if tags else 1)
+        for tag, index in index_of.items():
+            slots[tag] = index
+        return TagIndex(slots=slots, hash_mod=0, hash_keys=[], hash_slots=[], hash_displace=[], hash_bits=0)
+
+    hash_mod = construct_perfect_hash(tags)
+    displace, bits = ([], 0) if hash_mod else construct_displaced_hash(tags)
+    if displace:
+        hash_mod = 1 << bits
+    hash_keys = [0] * hash_mod
+    hash_slots = [-1] * hash_mod
+    for tag, index in index_of.items():
+        h = displaced_hash(tag, displace, bits) if displace else tag % hash_mod
+        hash_keys[h] = tag
+        hash_slots[h] = index
+    return TagIndex(slots=[], hash_mod=hash_mod, hash_keys=hash_keys, hash_slots=hash_slots,
+                    hash_displace=displace, hash_bits=bits)
+
+def construct_byte_set(values) -> tuple[list[int], list[int]]:
+    """the rows of a simd::ByteSet: bit (b >> 4) & 7 of row_lo[b & 15], or row_hi if b >= 0x80"""
+    row_lo, row_hi = [0] * 16, [0] * 16
+    for b in values:
+        (row_lo if b < 0x80 else row_hi)[b & 15] |= 1 << ((b >> 4) & 7)
+    return row_lo, row_hi
+
+def construct_dispatch_tables(ptypes: list[tuple[str, int]],
+                              candidates_init: dict[int, list[str]],
+                              candidates: dict[str, dict[int, list[str]]],
+                              self_first: dict[str, set[int]],
+                              merge_type_check: dict[str, dict[int, str]]) -> DispatchTables:
+    tags = sorted(set(candidates_init.keys()) |
+                  {tag for tag_ptypes in candidates.values() for tag in tag_ptypes} |
+                  {tag for tag_ptype in merge_type_check.values() for tag in tag_ptype})
+    tag_index = construct_tag_index({tag: slot for slot, tag in enumerate(tags)})
+
+    # identical candidate lists share one range of the pool
+    pool: list[str] = []
+    ranges: dict[tuple[str, ...], tuple[int, int]] = {(): (0, 0)}
+    # the states of a component share one list object; it keeps its id while it is held here
+    seen: dict[int, tuple[list[str], tuple[int, int]]] = {}
+    def add_range(lst: list[str]) -> tuple[int, int]:
+        if id(lst) in seen:
+            return seen[id(lst)][1]
+        key = tuple(lst)
+        if key not in ranges:
+            ranges[key] = (len(pool), len(pool) + len(lst))
+            pool.extend(lst)
+        seen[id(lst)] = (lst, ranges[key])
+        return ranges[key]
+
+    init_ranges = [add_range(candidates_init.get(tag, [])) for tag in tags]
+    candidate_ranges = [[add_range(candidates.get(ptype, {}).get(tag, [])) for tag in tags]
+                        for ptype, _ in ptypes]
+    self_first_rows = [[tag in self_first.get(ptype, ()) for tag in tags] for ptype, _ in ptypes]
+    merge_rows = [[merge_type_check[message_name].get(tag, "") for tag in tags]
+                  for message_name in merge_type_check.keys()]
+    start_bytes = construct_byte_set(tag if tag < 0x80 else (tag & 0x7f) | 0x80
+                                     for tag, init in candidates_init.items() if init)
+
+    return DispatchTables(tags=tags, tag_slots=tag_index.slots, hash_mod=tag_index.hash_mod,
+                          hash_keys=tag_index.hash_keys, hash_slots=tag_index.hash_slots,
+                          hash_displace=tag_index.hash_displace, hash_bits=tag_index.hash_bits, pool=pool,
+                          candidates_init=init_ranges, candidates=candidate_ranges, self_first=self_first_rows,
+                          lists=sorted(r for r in ranges.values() if r[1] - r[0] > 1),
+                          merge_type_check=merge_rows, start_bytes=start_bytes)
+
+@dataclass
+class SchemaFeatures:
+    """the inputs of the decoder cost model (CostModel in lib.h) that only depend on the schema"""
+    ambiguity: float     # mean number of CandidatesInit per tag
+    depth: int           # nesting depth below the main message, MAX_FEATURE_DEPTH if recursive
+    string_share: float  # share of string/bytes fields among the fields reachable from the main message
+
+def schema_features(messages: dict[str, list[Field]], candidates_init: dict[int, list[str]]) -> SchemaFeatures:
+    depths: dict[str, int] = {}
+    def depth(message_name: str, stack: frozenset) -> int:
+        if message_name in stack:
+            return MAX_FEATURE_DEPTH
+        if message_name not in depths:
+            children = [depth(field.proto_type, stack | {message_name})
+                        for field in messages[message_name] if field.is_embedded_message and not field.skip]
+            depths[message_name] = min(1 + max(children, default=0), MAX_FEATURE_DEPTH)
+        return depths[message_name]
+
+    # a projection drops the messages only its skipped fields reach
+    main_message_name = list(messages.keys())[0]
+    reachable = [main_message_name]
+    for message_name in reachable:
+        for field in messages[message_name]:
+            if field.is_embedded_message and not field.skip and field.proto_type not in reachable:
+                reachable.append(field.proto_type)
+    fields = [field for message_name in reachable for field in messages[message_name] if not field.skip]
+    strings = [field for field in fields if field.proto_type in ["string", "bytes"]]
+    inits = [len(init) for init in candidates_init.values() if init]
+
+    return SchemaFeatures(
+        ambiguity=sum(inits) / len(inits) if inits else 0,
+        depth=depth(main_message_name, frozenset()),
+        string_share=len(strings) / len(fields) if fields else 0,
+    )
+
+@dataclass
+class SppAnalysis:
+    """the schema analysis of SPP, computed once and shared by all generated files"""
+    ptypes: list[tuple[str, int]]
+    primary_ptype_mapping: dict[str, str]
+    dispatch: DispatchTables
+    candidate_groups: list[int]   # [ptype]: run-time reordering keeps the lower groups first
+    features: SchemaFeatures
+
+def analyze_spp(messages: dict[str, list[Field]], disable_type_prioritization: bool,
+                profile: TransitionProfile = None) -> SppAnalysis:
+    ptypes = construct_ptypes(messages)
+    candidates_init = construct_candidates_init(messages, disable_type_prioritization)
+    candidates, self_first = construct_candidates(messages, disable_type_prioritization)
+    first = set() if disable_type_prioritization else set(messages.keys())
+    if profile is not None:
+        candidates_init, candidates, self_first = apply_profile(candidates_init, candidates, self_first, profile, first)
+    return SppAnalysis(
+        ptypes=ptypes,
+        primary_ptype_mapping=construct_primary_ptype_mapping(messages),
+        dispatch=construct_dispatch_tables(
+            ptypes,
+            candidates_init,
+            candidates,
+            self_first,
+            construct_merge_type_check(messages),
+        ),
+        candidate_groups=[0 if ptype in first else 1 for ptype, _ in ptypes],
+        features=schema_features(messages, candidates_init),
+    )
@@ -0,0 +1,278 @@
+"""
+Writes synthetic inputs for a schema, from the same descriptor set gen_from_proto reads.
+
+The output is one main message. Its singular fields are written once, then elements of its
+repeated fields are generated in batches and streamed to the file until it reaches the target
+size, so multi-GB inputs never sit in memory. If the main message has no repeated field, the
+elements go under the nearest message that has one, reached through singular message fields
+(e.g. TwitterResponse.result.tweets); the lengths of those enclosing messages are written as
+5-byte varints and patched once the elements are out.
+
+Every element is generated within a byte budget (--item_size) that its sub-messages share,
+which, with --max_depth, also bounds recursive schemas. Each batch has its own seed, so the
+output depends on --seed but not on --workers.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import string
+import struct
+from collections import Counter
+from dataclasses import dataclass
+
+# gen_const imports gen_from_proto, which imports gen_const back; importing gen_from_proto
+# first would find gen_const half-initialized
+from . import gen_const  # noqa: F401
+from .gen_from_proto import Field, convert_proto_to_desc, parse_proto_from_descriptor, proto_file_prefix
+
+STRING_POOL_SIZE = 1 << 16  # string values are slices of one random text; longer ones are cut
+SCALAR_POOL_SIZE = 1 << 12  # encoded values drawn per scalar type
+BATCH_SIZE = 1 << 20        # bytes of elements generated per batch
+LENGTH_WIDTH = 5            # bytes of a patched length: a varint32 at its longest
+
+# kinds of field in a message plan
+MESSAGE, STRING, BYTES, PACKED, SCALAR = range(5)
+
+@dataclass
+class DatasetShape:
+    repeat: float = 4.0                # mean element count of a repeated field
+    string_length: int = 16            # mean length of a string/bytes value
+    string_distribution: str = "exp"   # of the lengths: fixed, uniform (0 to 2x mean) or exp
+    presence: float = 0.8              # probability that a singular field is set
+    max_depth: int = 8                 # sub-messages deeper than this are left out
+    # weight of the fields whose tag also belongs to another message, from 0 (only unique
+    # tags) to 1 (only shared tags); shared tags are what SPP speculation has to disambiguate
+    ambiguity: float = 0.5
+    item_size: int = 64 << 10          # byte budget of a top-level element
+
+def parse_size(text: str) -> int:
+    """a byte count, e.g. 4096, 100MB or 2GB"""
+    units = {"KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30}
+    for unit, scale in units.items():
+        if text.upper().endswith(unit):
+            return int(float(text[:-len(unit)]) * scale)
+    return int(text)
+
+def encode_varint(value: int) -> bytes:
+    if 0 <= value < 0x80:
+        return bytes((value,))
+    value &= (1 << 64) - 1  # negative values take 10 bytes, as in protobuf
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def encode_padded_varint(value: int, width: int) -> bytes:
+    """value in exactly width bytes; parsers accept the redundant continuation bytes"""
+    return bytes(((value >> (7 * i)) & 0x7f) | (0x80 if i < width - 1 else 0) for i in range(width))
+
+class DatasetGenerator:
+    def __init__(self, messages: dict[str, list[Field]], shape: DatasetShape, seed: int = 0):
+        self.messages = messages
+        self.shape = shape
+        self.seed = seed
+        self.rng = random.Random(seed)
+        owners = Counter(field.tag for fields in messages.values() for field in fields)
+        self.shared = {field.tag for fields in messages.values() for field in fields if owners[field.tag] > 1}
+
+        letters = (string.ascii_letters + string.digits + " ").encode()
+        self.text = bytes(self.rng.choices(letters, k=STRING_POOL_SIZE))
+        self.scalars = {}
+        for proto_type in sorted({field.proto_type for fields in messages.values() for field in fields}):
+            if proto_type not in messages and proto_type not in ["string", "bytes"]:
+                self.scalars[proto_type] = [self.scalar(proto_type) for _ in range(SCALAR_POOL_SIZE)]
+        # per message: (field, kind, tag bytes, mean count or presence probability)
+        self.plans = {name: [self.plan(field) for field in fields] for name, fields in messages.items()}
+
+    def weight(self, field: Field) -> float:
+        """1 for every field at the neutral ambiguity 0.5"""
+        return 2 * (self.shape.ambiguity if field.tag in self.shared else 1 - self.shape.ambiguity)
+
+    def plan(self, field: Field) -> tuple:
+        if field.is_embedded_message:
+            kind = MESSAGE
+        elif field.proto_type in ["string", "bytes"]:
+            kind = STRING if field.proto_type == "string" else BYTES
+        else:
+            kind = PACKED if field.is_repeated else SCALAR
+        odds = self.shape.repeat if field.is_repeated else self.shape.presence
+        return field, kind, encode_varint(field.tag), odds * self.weight(field)
+
+    def count(self, mean: float) -> int:
+        return int(self.rng.expovariate(1 / mean) + 0.5) if mean > 0 else 0
+
+    def scalar(self, proto_type: str) -> bytes:
+        rng = self.rng
+        if proto_type == "double":
+            return struct.pack("<d", rng.uniform(-1e6, 1e6))
+        if proto_type == "float":
+            return struct.pack("<f", rng.uniform(-1e6, 1e6))
+        if proto_type == "bool":
+            return encode_varint(rng.random() < 0.5)
+        # mostly small values, like ids and counters, with some of every varint length
+        bits = rng.choice([7, 7, 14, 21, 32] if proto_type.endswith("32") else [7, 7, 14, 28, 63])
+        value = rng.getrandbits(bits)
+        if proto_type.startswith("int"):
+            value &= (1 << (31 if proto_type == "int32" else 63)) - 1
+            if rng.random() < 0.1:
+                value = -value - 1
+        return encode_varint(value)
+
+    def string_length(self) -> int:
+        mean = self.shape.string_length
+        if self.shape.string_distribution == "fixed":
+            n = mean
+        elif self.shape.string_distribution == "uniform":
+            n = self.rng.randint(0, 2 * mean)
+        else:
+            n = int(self.rng.expovariate(1 / mean)) if mean > 0 else 0
+        return min(n, STRING_POOL_SIZE)
+
+    def values(self, out: bytearray, plan: tuple, n: int, depth: int, budget: int):
+        """appends n elements of a field, with their tags"""
+        field, kind, tag, _ = plan
+        rng = self.rng
+        if kind == MESSAGE:
+            for _ in range(n):
+                child = self.message(field.proto_type, depth + 1, budget // n)
+                out += tag + encode_varint(len(child)) + child
+        elif kind == STRING:
+            for _ in range(n):
+                length = self.string_length()
+                start = rng.randrange(STRING_POOL_SIZE - length + 1)
+                out += tag + encode_varint(length) + self.text[start:start + length]
+        elif kind == BYTES:
+            for _ in range(n):
+                length = self.string_length()
+                out += tag + encode_varint(length) + rng.randbytes(length)
+        elif kind == PACKED:
+            packed = b"".join(rng.choices(self.scalars[field.proto_type], k=n))
+            out += tag + encode_varint(len(packed)) + packed
+        else:
+            out += tag + rng.choice(self.scalars[field.proto_type])
+
+    def message(self, message_name: str, depth: int, budget: int, plans: list[tuple] = None) -> bytearray:
+        """the fields of a message, in field number order, until the budget is spent"""
+        out = bytearray()
+        rng = self.rng
+        for plan in self.plans[message_name] if plans is None else plans:
+            if len(out) >= budget:
+                break
+            field, kind, _, odds = plan
+            if kind == MESSAGE and depth + 1 > self.shape.max_depth:
+                continue
+            n = self.count(odds) if field.is_repeated else int(rng.random() < odds)
+            if n > 0:
+                self.values(out, plan, n, depth, budget - len(out))
+        return out
+
+    def bulk_path(self, root: str) -> list[Field]:
+        """singular message fields from root down to the nearest message with repeated fields"""
+        paths = {root: []}
+        queue = [root]
+        for name in queue:
+            if any(field.is_repeated for field in self.messages[name]):
+                return paths[name]
+            for field in self.messages[name]:
+                if field.is_embedded_message and field.proto_type not in paths:
+                    paths[field.proto_type] = paths[name] + [field]
+                    queue.append(field.proto_type)
+        raise ValueError(f"{root} has no repeated field to fill the input with")
+
+    def batch(self, message_name: str, depth: int, index: int, size: int) -> bytearray:
+        """about size bytes of elements of the repeated fields of a message"""
+        self.rng = random.Random(f"{self.seed}:{index}")
+        plans = [plan for plan in self.plans[message_name] if plan[0].is_repeated]
+        weights = [self.weight(plan[0]) for plan in plans]
+        if sum(weights) == 0:
+            weights = None
+        out = bytearray()
+        while len(out) < size:
+            plan = self.rng.choices(plans, weights)[0]
+            n = max(self.count(plan[3]), 1) if plan[1] == PACKED else 1
+            self.values(out, plan, n, depth, self.shape.item_size)
+        return out
+
+    def write(self, path: str, size: int, workers: int = 1) -> int:
+        """streams a main message of about size bytes to path; returns the bytes written"""
+        name = list(self.messages.keys())[0]
+        wrappers = self.bulk_path(name)
+        if wrappers and size >= 1 << 32:
+            raise ValueError(f"elements nested in {name} are limited to 4GB")
+
+        with open(path, "wb", buffering=1 << 20) as f:
+            holes = []  # offsets of the lengths of the enclosing messages
+            for field in wrappers + [None]:
+                singular = [plan for plan in self.plans[name] if not plan[0].is_repeated and plan[0] is not field]
+                f.write(self.message(name, len(holes), self.shape.item_size, singular))
+                if field is not None:
+                    f.write(encode_varint(field.tag))
+                    holes.append(f.tell())
+                    f.write(bytes(LENGTH_WIDTH))
+                    name = field.proto_type
+
+            remaining = max(size - f.tell(), 1)
+            args = [(name, len(holes), index, min(BATCH_SIZE, remaining - index * BATCH_SIZE))
+                    for index in range((remaining + BATCH_SIZE - 1) // BATCH_SIZE)]
+            if workers > 1:
+                with multiprocessing.Pool(workers, _init_worker, (self.messages, self.shape, self.seed)) as pool:
+                    for out in pool.imap(_batch, args):
+                        f.write(out)
+            else:
+                for arg in args:
+                    f.write(self.batch(*arg))
+
+            end = f.tell()
+            for hole in holes:
+                f.seek(hole)
+                f.write(encode_padded_varint(end - hole - LENGTH_WIDTH, LENGTH_WIDTH))
+        return end
+
+_worker: DatasetGenerator = None
+
+def _init_worker(messages: dict[str, list[Field]], shape: DatasetShape, seed: int):
+    global _worker
+    _worker = DatasetGenerator(messages, shape, seed)
+
+def _batch(args: tuple) -> bytearray:
+    return _worker.batch(*args)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file_path", help="protobuf schema file path")
+    parser.add_argument("--size", default="64MB", help="target size, e.g. 100MB or 2GB")
+    parser.add_argument("--out", help="output path (default ./dataset/<schema>_synth.pb)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="processes generating batches")
+    defaults = DatasetShape()
+    parser.add_argument("--repeat", type=float, default=defaults.repeat,
+                        help="mean element count of a repeated field")
+    parser.add_argument("--string_length", type=int, default=defaults.string_length,
+                        help="mean length of a string/bytes value")
+    parser.add_argument("--string_distribution", choices=["fixed", "uniform", "exp"],
+                        default=defaults.string_distribution)
+    parser.add_argument("--presence", type=float, default=defaults.presence,
+                        help="probability that a singular field is set")
+    parser.add_argument("--max_depth", type=int, default=defaults.max_depth,
+                        help="sub-messages deeper than this are left out")
+    parser.add_argument("--ambiguity", type=float, default=defaults.ambiguity,
+                        help="weight of the fields whose tag is shared with another message, in [0, 1]")
+    parser.add_argument("--item_size", default=str(defaults.item_size),
+                        help="byte budget of a top-level element")
+    args = parser.parse_args()
+
+    shape = DatasetShape(repeat=args.repeat, string_length=args.string_length,
+                         string_distribution=args.string_distribution, presence=args.presence,
+                         max_depth=args.max_depth, ambiguity=args.ambiguity,
+                         item_size=parse_size(args.item_size))
+    messages = parse_proto_from_descriptor(convert_proto_to_desc(args.file_path))
+    out = args.out or os.path.join("./dataset", proto_file_prefix(args.file_path) + "_synth.pb")
+
+    written = DatasetGenerator(messages, shape, args.seed).write(out, parse_size(args.size), args.workers)
+    print(f"wrote {out} ({written} bytes)")
+
+if __name__ == "__main__":
+    main()
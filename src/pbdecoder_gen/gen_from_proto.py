@@ -2,7 +2,7 @@ import os
 import sys
 import re
 import argparse
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from pprint import pprint
 from google.protobuf import descriptor_pb2
 from jinja2 import Environment, FileSystemLoader
@@ -21,6 +21,7 @@ SPP = Speculative Parallel Parser
 NAMESPACE_BL = "BL"
 NAMESPACE_TPP = "TPP"
 NAMESPACE_SPP = "SPP"
+NAMESPACE_COL = "COL"
 
 prototype_to_cpptype = {
     "uint32": "uint32_t",
@@ -28,8 +29,8 @@ prototype_to_cpptype = {
     "int32": "int32_t",
     "int64": "int64_t",
     "bool": "bool",
-    "string": "std::string",
-    "bytes": "std::string",
+    "string": "string_t",
+    "bytes": "string_t",
     "double": "double",
     "float": "float",
 }
@@ -42,12 +43,23 @@ wiretype_to_prototype = {
 
 prototype_to_wiretype = {proto: key for key, protos in wiretype_to_prototype.items() for proto in protos}
 
+prototype_to_numpytype = {
+    "uint32": "NPY_UINT32",
+    "uint64": "NPY_UINT64",
+    "int32": "NPY_INT32",
+    "int64": "NPY_INT64",
+    "bool": "NPY_BOOL",
+    "double": "NPY_FLOAT64",
+    "float": "NPY_FLOAT32",
+}
+
 partial_parse_templates = {
     0: {"_uint32", "_int32", "_uint64", "_int64", "_bool"},
     1: {"_double", "_float"},
     2: {"_uint32_array", "_int32_array", "_uint64_array", "_int64_array", "_bool_array"},
     3: {"_double_array", "_float_array"},
     4: {"_string", "_bytes"},
+    5: {"_skip"},
 }
 
 @dataclass
@@ -57,6 +69,7 @@ class Field:
     is_repeated: bool
     is_embedded_message: bool
     proto_type: str
+    skip: bool = False  # not in the projection: the value is skipped, not decoded
 
     @property
     def cpp_type_single(self) -> str:
@@ -67,7 +80,7 @@ class Field:
     @property
     def cpp_type(self) -> str:
         if self.is_repeated:
-            return f"std::vector<{self.cpp_type_single}>"
+            return f"vector_t<{self.cpp_type_single}>"
         else:
             return self.cpp_type_single
 
@@ -102,6 +115,9 @@ class Field:
         '''
         only used in Speculative Parsing
         '''
+        if self.skip:
+            return "_skip"
+
         if (self.proto_type in wiretype_to_prototype[0] or \
             self.proto_type in wiretype_to_prototype[1] or \
              self.proto_type in wiretype_to_prototype[5]) and self.is_repeated:
@@ -205,6 +221,62 @@ def parse_proto_from_descriptor(desc_path: str) -> Dict[str, List[Field]]:
 
     return messages
 
+def apply_projection(messages: Dict[str, List[Field]], paths: List[str]):
+    """
+    Keeps only the fields on the given paths from the main message, e.g. "sample.value".
+    A path ending at a message field keeps the whole subtree of that field. Decoders are
+    generated per message type, so a type reached by several paths keeps the union of
+    their fields.
+
+    Returns the projected messages, without the types that are not reached, and the
+    fields each projected type skips.
+    """
+    root = list(messages.keys())[0]
+    kept: Dict[str, set] = {root: set()}
+
+    def keep_subtree(message_name: str):
+        names = {field.name for field in messages[message_name]}
+        if kept.get(message_name) == names:
+            return
+        kept[message_name] = names
+        for field in messages[message_name]:
+            if field.is_embedded_message:
+                keep_subtree(field.proto_type)
+
+    for path in paths:
+        message_name = root
+        names = path.split(".")
+        for i, name in enumerate(names):
+            field = next((f for f in messages[message_name] if f.name == name), None)
+            if field is None:
+                raise ValueError(f"Unknown field '{name}' of message '{message_name}' in projection '{path}'.")
+            kept.setdefault(message_name, set()).add(name)
+            if i + 1 == len(names):
+                if field.is_embedded_message:
+                    keep_subtree(field.proto_type)
+            elif not field.is_embedded_message:
+                raise ValueError(f"Field '{name}' in projection '{path}' is not a message.")
+            else:
+                message_name = field.proto_type
+
+    projected: Dict[str, List[Field]] = {}
+    skipped_fields: Dict[str, List[Field]] = {}
+    for message_name, fields in messages.items():
+        if message_name not in kept:
+            continue
+        projected[message_name] = [f for f in fields if f.name in kept[message_name]]
+        skipped_fields[message_name] = [replace(f, skip=True) for f in fields if f.name not in kept[message_name]]
+
+    print(f"The number of projected message: {len(projected)}")
+    print(f"The number of projected field: {sum(len(fields) for fields in projected.values())}")
+
+    return projected, skipped_fields
+
+def parsed_fields(messages: Dict[str, List[Field]], skipped_fields: Dict[str, List[Field]]) -> Dict[str, List[Field]]:
+    """the fields a decoder must recognize: the projected ones and the skipped ones"""
+    return {message_name: sorted(fields + skipped_fields[message_name], key=lambda x: x.field_id)
+            for message_name, fields in messages.items()}
+
 def generated_file_dir():
     current_dir = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(current_dir, "../../artifact/generated")
@@ -233,6 +305,12 @@ def test_file_name(file_path):
 def test_file_path(file_path):
     return os.path.join(generated_file_dir(), test_file_name(file_path))
 
+def python_module_name(file_path):
+    return proto_file_prefix(file_path) + "_specproto"
+
+def python_file_path(file_path):
+    return os.path.join(generated_file_dir(), proto_file_prefix(file_path) + ".python.cpp")
+
 # generate the .pbs.h file
 def generate_bl_header(args, messages: dict[str, list[Field]]):
     with open(header_file_path(NAMESPACE_BL, args.file_path), "w") as f:
@@ -240,65 +318,89 @@ def generate_bl_header(args, messages: dict[str, list[Field]]):
             proto_file_prefix=proto_file_prefix(args.file_path),
             namespace=NAMESPACE_BL,
             messages=messages,
+            main_message_name=list(messages.keys())[0],
+            zero_copy_strings=args.zero_copy_strings,
         ))
 
-def generate_bl_cpp(args, messages: dict[str, list[Field]]):
+def generate_bl_cpp(args, messages: dict[str, list[Field]], skipped_fields: dict[str, list[Field]]):
     with open(cpp_file_path(NAMESPACE_BL, args.file_path), "w") as f:
         f.write(jinja_env.get_template('bl/cpp.jinja').render(
             header_file_name=header_file_name(NAMESPACE_BL, args.file_path),
             namespace=NAMESPACE_BL,
             messages=messages,
+            skipped_fields=skipped_fields,
             wiretype_to_prototype=wiretype_to_prototype,
         ))
 
-def generate_tpp_header(args, messages: dict[str, list[Field]]):
+def generate_tpp_header(args, messages: dict[str, list[Field]], skipped_fields: dict[str, list[Field]]):
     with open(header_file_path(NAMESPACE_TPP, args.file_path), "w") as f:
         f.write(jinja_env.get_template('tpp/header.jinja').render(
             proto_file_prefix=proto_file_prefix(args.file_path),
             namespace=NAMESPACE_TPP,
             messages=messages,
-            valid_tags=gen_const.valid_tags,
+            parsed_fields=parsed_fields(messages, skipped_fields),
+            main_message_name=list(messages.keys())[0],
+            zero_copy_strings=args.zero_copy_strings,
+            field_index=gen_const.construct_tpp_field_index,
         ))
 
-def generate_tpp_cpp(args, messages: dict[str, list[Field]]):
+def generate_tpp_cpp(args, messages: dict[str, list[Field]], skipped_fields: dict[str, list[Field]]):
     with open(cpp_file_path(NAMESPACE_TPP, args.file_path), "w") as f:
         f.write(jinja_env.get_template('tpp/cpp.jinja').render(
             header_file_name=header_file_name(NAMESPACE_TPP, args.file_path),
             namespace=NAMESPACE_TPP,
             messages=messages,
+            parsed_fields=parsed_fields(messages, skipped_fields),
+            skipped_fields=skipped_fields,
             wiretype_to_prototype=wiretype_to_prototype,
         ))
 
-def generate_spp_header(args, messages: dict[str, list[Field]]):
+def generate_spp_header(args, messages: dict[str, list[Field]], spp: "gen_const.SppAnalysis"):
     with open(header_file_path(NAMESPACE_SPP, args.file_path), "w") as f:
         f.write(jinja_env.get_template('spp/header.jinja').render(
             proto_file_prefix=proto_file_prefix(args.file_path),
             namespace=NAMESPACE_SPP,
             messages=messages,
             main_message_name=list(messages.keys())[0],
-            ptypes=gen_const.construct_ptypes(messages),
-            primary_ptype_mapping=gen_const.construct_primary_ptype_mapping(messages),
-            candidates_init=gen_const.construct_candidates_init(messages, args.disable_type_prioritization),
-            candidates=gen_const.construct_candidates(messages, args.disable_type_prioritization),
-            merge_type_check=gen_const.construct_merge_type_check(messages),
+            zero_copy_strings=args.zero_copy_strings,
+            ptypes=spp.ptypes,
+            primary_ptype_mapping=spp.primary_ptype_mapping,
+            partial_parse_templates=partial_parse_templates,
+            dispatch=spp.dispatch,
+            candidate_groups=spp.candidate_groups,
+            features=spp.features,
         ))
 
-def generate_spp_cpp(args, messages: dict[str, list[Field]]):
+def generate_spp_cpp(args, messages: dict[str, list[Field]], skipped_fields: dict[str, list[Field]],
+                     spp: "gen_const.SppAnalysis"):
     with open(cpp_file_path(NAMESPACE_SPP, args.file_path), "w") as f:
         f.write(jinja_env.get_template('spp/cpp.jinja').render(
             header_file_name=header_file_name(NAMESPACE_SPP, args.file_path),
             namespace=NAMESPACE_SPP,
             messages=messages,
+            skipped_fields=skipped_fields,
             main_message_name=list(messages.keys())[0],
-            ptypes=gen_const.construct_ptypes(messages),
+            ptypes=spp.ptypes,
+            primary_ptype_mapping=spp.primary_ptype_mapping,
             partial_parse_templates=partial_parse_templates,
             wiretype_to_prototype=wiretype_to_prototype,
         ))
 
+def generate_columnar_header(args, messages: dict[str, list[Field]]):
+    with open(header_file_path(NAMESPACE_COL, args.file_path), "w") as f:
+        f.write(jinja_env.get_template('columnar.jinja').render(
+            proto_file_prefix=proto_file_prefix(args.file_path),
+            namespace=NAMESPACE_COL,
+            messages=messages,
+            main_message_name=list(messages.keys())[0],
+            file_path=args.file_path,
+            header_file_name=header_file_name,
+        ))
+
 # NOTE:
 # 1. the first message should be the main message
 # 2. the package name should be PB, e.g., package PB;
-def generate_test(args, messages: dict[str, list[Field]]):
+def generate_test(args, messages: dict[str, list[Field]], skipped_fields: dict[str, list[Field]]):
     with open(test_file_path(args.file_path), "w") as f:
         f.write(jinja_env.get_template('test.jinja').render(
             proto_file_prefix=proto_file_prefix(args.file_path),
@@ -308,26 +410,77 @@ def generate_test(args, messages: dict[str, list[Field]]):
             test_bl=True,
             test_tpp=True,
             test_spp=True,
+            zero_copy_strings=args.zero_copy_strings,
+            columnar=args.columnar,
+            messages=messages,
+            skipped_fields=skipped_fields,
+        ))
+
+def generate_python(args, messages: dict[str, list[Field]]):
+    with open(python_file_path(args.file_path), "w") as f:
+        f.write(jinja_env.get_template('python.jinja').render(
+            proto_file_prefix=proto_file_prefix(args.file_path),
+            module_name=python_module_name(args.file_path),
+            main_message_name=list(messages.keys())[0],
+            file_path=args.file_path,
+            header_file_name=header_file_name,
+            messages=messages,
+            numpy_types=prototype_to_numpytype,
+            zero_copy_strings=args.zero_copy_strings,
         ))
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("file_path", help="protobuf schema file path")
     parser.add_argument("--disable_type_prioritization", action="store_true")
+    parser.add_argument("--zero_copy_strings", action="store_true",
+                        help="string/bytes fields point into the input buffer instead of copying")
+    parser.add_argument("--columnar", action="store_true",
+                        help="also generate a struct-of-arrays export of the decoded messages (a second pass)")
+    parser.add_argument("--python_module", action="store_true",
+                        help="also generate a CPython extension exposing the BL/SPP decoders")
+    parser.add_argument("--projection", default="",
+                        help="comma-separated field paths to decode, e.g. sample.value,string_table; "
+                             "the other fields are skipped")
+    parser.add_argument("--profile", action="append", default=[], metavar="SAMPLE",
+                        help="serialized main message to profile; SPP candidates are ordered by how "
+                             "often they occur in the samples, and the ones never seen are pruned "
+                             "(may be given several times)")
     args = parser.parse_args()
 
+    if args.zero_copy_strings:
+        prototype_to_cpptype["string"] = prototype_to_cpptype["bytes"] = "StringRef"
+
     messages = parse_proto_from_descriptor(convert_proto_to_desc(args.file_path))
 
+    if args.projection:
+        messages, skipped_fields = apply_projection(messages, args.projection.split(","))
+    else:
+        skipped_fields = {message_name: [] for message_name in messages}
+
     generate_bl_header(args, messages)
-    generate_bl_cpp(args, messages)
+    generate_bl_cpp(args, messages, skipped_fields)
+
+    generate_tpp_header(args, messages, skipped_fields)
+    generate_tpp_cpp(args, messages, skipped_fields)
+
+    # skipped fields still take part in speculation, as the PType _skip
+    spp_messages = parsed_fields(messages, skipped_fields)
+    profile = None
+    if args.profile:
+        profile = gen_const.profile_transitions(spp_messages, args.profile)
+        print(f"profiled {profile.samples} samples ({profile.bytes} bytes)")
+    spp = gen_const.analyze_spp(spp_messages, args.disable_type_prioritization, profile)
+    generate_spp_header(args, messages, spp)
+    generate_spp_cpp(args, messages, skipped_fields, spp)
 
-    generate_tpp_header(args, messages)
-    generate_tpp_cpp(args, messages)
+    if args.columnar:
+        generate_columnar_header(args, messages)
 
-    generate_spp_header(args, messages)
-    generate_spp_cpp(args, messages)
+    generate_test(args, messages, skipped_fields)
 
-    generate_test(args, messages)
+    if args.python_module:
+        generate_python(args, messages)
 
 
 if __name__ == "__main__":